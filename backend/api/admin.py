@@ -0,0 +1,56 @@
+from django.contrib import messages
+
+from api.constans import DELETE_SYNC_MAX
+from api.deletion import cascade_count
+
+
+class FastDeleteAdminMixin:
+    """
+    Удаление в админке через api.deletion вместо Collector: страница
+    подтверждения показывает число строк по моделям, а не каждую строку,
+    большие удаления уходят в фоновую задачу delete_task.
+    """
+    delete_function = None
+    delete_task = None
+
+    def get_deleted_objects(self, objs, request):
+        counts = cascade_count(
+            self.model._base_manager.filter(pk__in=[obj.pk for obj in objs])
+        )
+        registry = self.admin_site._registry
+        perms_needed = {
+            model._meta.verbose_name for model in counts
+            if model in registry
+            and not registry[model].has_delete_permission(request)
+        }
+        model_count = {
+            model._meta.verbose_name_plural: count
+            for model, count in counts.items()
+        }
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def deletion_size(self, queryset):
+        """Число корневых строк, которые удалит delete_function."""
+        return queryset.count()
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
+        queryset = self.model.objects.filter(pk__in=pks)
+        if self.deletion_size(queryset) < DELETE_SYNC_MAX:
+            self.delete_function(queryset)
+            return
+        job = self.offload(request, queryset)
+        self.message_user(
+            request,
+            f'Удаление продолжится в фоне, статус: /api/jobs/{job.pk}/',
+            messages.INFO,
+        )
+
+    def offload(self, request, queryset):
+        return self.delete_task.enqueue(
+            args=[list(queryset.values_list('pk', flat=True))],
+            user=request.user,
+        )
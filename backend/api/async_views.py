@@ -0,0 +1,102 @@
+"""
+Асинхронные версии тяжёлых по вводу-выводу эндпоинтов.
+
+Подключаются в api/urls.py при SERVER_MODE=asgi; запросы к базе
+выполняются в ограниченном пуле потоков foodgram.executors.
+"""
+from django.http import HttpResponse
+
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.authentication import CachedTokenAuthentication
+from api.filters import IngredientFilter
+from api.serializers import IngredientSerializer
+from api.views import IngredientViewSet, RecipeViewSet, UserViewSet
+from foodgram.executors import database_sync_to_async
+from recipes.models import Ingredient
+
+renderer = JSONRenderer()
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        renderer.render(data),
+        status=status_code,
+        content_type=renderer.media_type,
+    )
+
+
+def error_response(error):
+    response = json_response({'detail': error.detail}, error.status_code)
+    if error.status_code == status.HTTP_401_UNAUTHORIZED:
+        response['WWW-Authenticate'] = (
+            CachedTokenAuthentication().authenticate_header(None)
+        )
+    return response
+
+
+@database_sync_to_async
+def authenticate(request):
+    """DRF-запрос с пользователем, определённым по токену."""
+    drf_request = Request(
+        request, authenticators=(CachedTokenAuthentication(),)
+    )
+    if not drf_request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return drf_request
+
+
+def get_only(view):
+    async def inner(request):
+        if request.method != 'GET':
+            return error_response(
+                exceptions.MethodNotAllowed(request.method)
+            )
+        try:
+            return await view(request)
+        except exceptions.APIException as error:
+            return error_response(error)
+    return inner
+
+
+@database_sync_to_async
+def cart_ingredients(user):
+    return list(RecipeViewSet.cart_ingredients(user))
+
+
+@database_sync_to_async
+def search_ingredients(params):
+    if not params:
+        return IngredientViewSet.reference_list()
+    ingredients = IngredientFilter(
+        params, queryset=Ingredient.objects.all()
+    ).qs
+    return IngredientSerializer(ingredients, many=True).data
+
+
+@database_sync_to_async
+def subscriptions_page(request):
+    return UserViewSet.subscriptions_response(request).data
+
+
+@get_only
+async def download_shopping_cart(request):
+    """Скачивание списка покупок."""
+    drf_request = await authenticate(request)
+    ingredients = await cart_ingredients(drf_request.user)
+    return RecipeViewSet.ingredients_to_csv(ingredients)
+
+
+@get_only
+async def ingredient_list(request):
+    """Поиск ингредиентов по началу названия."""
+    return json_response(await search_ingredients(request.GET))
+
+
+@get_only
+async def subscriptions(request):
+    """Список авторов, на которых подписан пользователь."""
+    drf_request = await authenticate(request)
+    return json_response(await subscriptions_page(drf_request))
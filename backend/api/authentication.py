@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import record_lookups
+from api.constans import (
+    AUTH_TOKEN_KEY,
+    AUTH_TOKEN_LOCAL_SIZE,
+    AUTH_TOKEN_LOCAL_TTL,
+    AUTH_TOKEN_TIMEOUT,
+)
+
+
+class LocalLRUCache:
+    """Потокобезопасный LRU-кеш процесса с ограничением времени жизни."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (value, time.monotonic() + self.ttl)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+
+local_tokens = LocalLRUCache(AUTH_TOKEN_LOCAL_SIZE, AUTH_TOKEN_LOCAL_TTL)
+
+
+def token_cache_key(key):
+    """В ключ кеша попадает хеш токена, а не сам токен."""
+    return AUTH_TOKEN_KEY.format(
+        digest=hashlib.sha256(key.encode()).hexdigest()
+    )
+
+
+def invalidate_tokens(keys):
+    """
+    Удалить токены из общего кеша и кеша текущего процесса, в транзакции
+    ещё раз после фиксации: до неё параллельный запрос может закешировать
+    старую строку.
+    """
+    cache_keys = [token_cache_key(key) for key in keys]
+
+    def delete():
+        for cache_key in cache_keys:
+            local_tokens.delete(cache_key)
+        cache.delete_many(cache_keys)
+
+    delete()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(delete)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену без запроса к базе на каждый вызов API.
+
+    Токен ищется в LRU-кеше процесса, затем в общем кеше и только потом
+    в базе. В кешах лежат только id пользователя и is_active, объекты
+    User и Token строятся заново на каждый запрос, остальные поля
+    пользователя читаются из базы при первом обращении. Сигналы и
+    удаление пользователя сбрасывают записи; в других процессах запись
+    живёт не дольше AUTH_TOKEN_LOCAL_TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        cache_key = token_cache_key(key)
+        entry = local_tokens.get(cache_key)
+        record_lookups('auth_token_local', entry is not None, 1)
+        if entry is None:
+            entry = cache.get(cache_key)
+            record_lookups('auth_token', entry is not None, 1)
+            if entry is None:
+                user, token = super().authenticate_credentials(key)
+                entry = (user.pk, user.is_active)
+                cache.set(cache_key, entry, timeout=AUTH_TOKEN_TIMEOUT)
+            local_tokens.set(cache_key, entry)
+        user_id, is_active = entry
+        if not is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return self.rebuild(key, user_id, is_active)
+
+    def rebuild(self, key, user_id, is_active):
+        """Свежие User и Token из записи кеша, без запроса к базе."""
+        model = self.get_model()
+        user_model = model._meta.get_field('user').related_model
+        user = user_model.from_db(
+            router.db_for_read(user_model), ['id', 'is_active'],
+            [user_id, is_active],
+        )
+        token = model.from_db(
+            router.db_for_read(model), ['key', 'user_id'], [key, user_id]
+        )
+        token.user = user
+        return user, token
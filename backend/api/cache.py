@@ -0,0 +1,219 @@
+import time
+
+from django.core.cache import cache, caches
+from django.db import transaction
+
+from api import metrics
+from api.constans import (
+    CATALOG_VERSION_KEY,
+    RECIPE_CHANGE_KEY,
+    RECIPE_CHANGE_TIMEOUT,
+    RECIPE_CHANGES_ALL,
+    RECIPE_CHANGES_MAX,
+    RECIPE_CHANGES_SEQ_KEY,
+    RECIPE_FACETS_KEY,
+    RECIPE_FACETS_TIMEOUT,
+    RECIPE_FACETS_VERSION_KEY,
+    RECIPE_FRAGMENT_KEY,
+    RECIPE_FRAGMENT_TIMEOUT,
+    REFERENCE_KEY,
+    REFERENCE_TIMEOUT,
+)
+
+
+def record_lookups(name, hits, total):
+    """Попадания и промахи кеша для метрик."""
+    metrics.inc(
+        'foodgram_cache_requests_total', {'cache': name, 'result': 'hit'},
+        hits,
+    )
+    metrics.inc(
+        'foodgram_cache_requests_total', {'cache': name, 'result': 'miss'},
+        total - hits,
+    )
+
+
+def versions():
+    """Кеш счётчиков версий, отдельный от вытесняемых данных."""
+    return caches['versions']
+
+
+def initial_version():
+    """
+    Потерянный счётчик (перезапуск кеша) начинается с текущего времени
+    в миллисекундах, а не с 1: ключи старых версий не переиспользуются.
+    """
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    """Текущая версия справочников (теги, ингредиенты, авторы)."""
+    version = versions().get(CATALOG_VERSION_KEY)
+    if version is None:
+        versions().add(CATALOG_VERSION_KEY, initial_version(), timeout=None)
+        version = versions().get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Смена версии делает недействительными все фрагменты рецептов."""
+    try:
+        versions().incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        versions().set(CATALOG_VERSION_KEY, initial_version(), timeout=None)
+
+
+def recipe_fragment_key(recipe_id, version):
+    return RECIPE_FRAGMENT_KEY.format(version=version, id=recipe_id)
+
+
+def get_recipe_fragments(recipe_ids):
+    """Закешированные общие части рецептов в виде {id: фрагмент}."""
+    version = get_catalog_version()
+    keys = {
+        recipe_fragment_key(recipe_id, version): recipe_id
+        for recipe_id in recipe_ids
+    }
+    fragments = {
+        keys[key]: fragment
+        for key, fragment in cache.get_many(list(keys)).items()
+    }
+    record_lookups('recipe_fragment', len(fragments), len(keys))
+    return fragments
+
+
+def set_recipe_fragments(fragments):
+    """Сохранить общие части рецептов {id: фрагмент}."""
+    version = get_catalog_version()
+    cache.set_many(
+        {
+            recipe_fragment_key(recipe_id, version): fragment
+            for recipe_id, fragment in fragments.items()
+        },
+        timeout=RECIPE_FRAGMENT_TIMEOUT,
+    )
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    """
+    Удалить фрагменты перечисленных рецептов сразу и ещё раз после
+    фиксации транзакции: до фиксации параллельный запрос может снова
+    закешировать старую строку из базы.
+    """
+    recipe_ids = list(recipe_ids)
+
+    def delete():
+        version = get_catalog_version()
+        cache.delete_many([
+            recipe_fragment_key(recipe_id, version)
+            for recipe_id in recipe_ids
+        ])
+
+    delete()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(delete)
+
+
+def get_reference_list(name, build):
+    """Справочник целиком (теги, ингредиенты) для текущей версии."""
+    key = REFERENCE_KEY.format(version=get_catalog_version(), name=name)
+    data = cache.get(key)
+    record_lookups('reference', int(data is not None), 1)
+    if data is None:
+        data = list(build())
+        cache.set(key, data, timeout=REFERENCE_TIMEOUT)
+    return data
+
+
+def get_recipe_facets(filters, build):
+    """
+    Счётчики фасетов для ключа фильтров filters. Ключ кеша меняется
+    вместе с версией каталога и версией связей рецептов с тегами.
+    """
+    key = RECIPE_FACETS_KEY.format(
+        catalog=get_catalog_version(),
+        recipes=get_recipe_facets_version(),
+        filters=filters,
+    )
+    data = cache.get(key)
+    record_lookups('recipe_facets', int(data is not None), 1)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout=RECIPE_FACETS_TIMEOUT)
+    return data
+
+
+def get_recipe_facets_version():
+    version = versions().get(RECIPE_FACETS_VERSION_KEY)
+    if version is None:
+        versions().add(
+            RECIPE_FACETS_VERSION_KEY, initial_version(), timeout=None
+        )
+        version = versions().get(RECIPE_FACETS_VERSION_KEY)
+    return version
+
+
+def bump_recipe_facets_version():
+    """Сбросить счётчики фасетов после фиксации транзакции."""
+
+    def bump():
+        try:
+            versions().incr(RECIPE_FACETS_VERSION_KEY)
+        except ValueError:
+            versions().set(
+                RECIPE_FACETS_VERSION_KEY, initial_version(), timeout=None
+            )
+
+    transaction.on_commit(bump)
+
+
+def record_recipe_changes(recipe_ids):
+    """
+    Записать изменение состава рецептов в общую ленту изменений.
+
+    None вместо списка означает, что изменились все рецепты. Запись
+    происходит после фиксации транзакции, чтобы другие процессы
+    читали из базы уже новые данные.
+    """
+    recipe_ids = RECIPE_CHANGES_ALL if recipe_ids is None else list(recipe_ids)
+
+    def record():
+        try:
+            seq = versions().incr(RECIPE_CHANGES_SEQ_KEY)
+        except ValueError:
+            versions().add(RECIPE_CHANGES_SEQ_KEY, 0, timeout=None)
+            seq = versions().incr(RECIPE_CHANGES_SEQ_KEY)
+        cache.set(
+            RECIPE_CHANGE_KEY.format(seq=seq), recipe_ids,
+            timeout=RECIPE_CHANGE_TIMEOUT,
+        )
+
+    transaction.on_commit(record)
+
+
+def get_recipe_changes_seq():
+    return versions().get(RECIPE_CHANGES_SEQ_KEY, 0)
+
+
+def get_recipe_changes(since, until):
+    """
+    Изменённые рецепты между номерами since и until ленты.
+
+    Возвращает номер, до которого лента прочитана, и множество id
+    рецептов; None вместо множества — нужна полная перестройка.
+    """
+    if until < since or until - since > RECIPE_CHANGES_MAX:
+        return until, None
+    keys = [
+        RECIPE_CHANGE_KEY.format(seq=seq)
+        for seq in range(since + 1, until + 1)
+    ]
+    changes = cache.get_many(keys)
+    recipe_ids = set()
+    for seq, key in enumerate(keys, start=since + 1):
+        if key not in changes:
+            return seq - 1, recipe_ids
+        if changes[key] == RECIPE_CHANGES_ALL:
+            return until, None
+        recipe_ids.update(changes[key])
+    return until, recipe_ids
@@ -1 +1,68 @@
 MIN_VALUE = 1
+CATALOG_VERSION_KEY = 'catalog_version'
+RECIPE_FRAGMENT_KEY = 'recipe_fragment:{version}:{id}'
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60 * 24
+AUTH_TOKEN_KEY = 'auth_token:{digest}'
+AUTH_TOKEN_TIMEOUT = 60 * 15
+AUTH_TOKEN_LOCAL_TTL = 10
+AUTH_TOKEN_LOCAL_SIZE = 10000
+SLOWEST_QUERIES_LOGGED = 3
+REFERENCE_KEY = 'reference:{version}:{name}'
+REFERENCE_TIMEOUT = 60 * 60 * 24
+RECIPE_CHANGES_SEQ_KEY = 'recipe_changes_seq'
+RECIPE_CHANGE_KEY = 'recipe_change:{seq}'
+RECIPE_CHANGE_TIMEOUT = 60 * 60
+RECIPE_CHANGES_ALL = 'all'
+RECIPE_CHANGES_MAX = 1000
+RECIPE_CHANGES_GRACE = 5
+INGREDIENT_INDEX_MAX_DELTA = 10000
+SPARSE_QUERY_RATIO = 8
+MINHASH_PERMUTATIONS = 32
+MINHASH_PRIME = 2 ** 31 - 1
+MINHASH_SEED = 20240501
+MINHASH_CHUNK = 50000
+LSH_BANDS = 8
+LSH_BUCKET_LIMIT = 200
+SIMILARITY_INDEX_MAX_DELTA = 10000
+SIMILAR_RECIPES_MAX = 50
+INGREDIENT_SEARCH_MAX = 100
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+METRICS_FILE = '{pid}-{boot}.json'
+METRICS_ARCHIVE = 'archive.json'
+METRICS_LOCK = '.lock'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_NAME = '{time}_{view}.{action}_{pid}.prof'
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+DEFERRABLE_RECIPE_FIELDS = ('name', 'image', 'text', 'cooking_time')
+DEFERRABLE_USER_FIELDS = ('email', 'username', 'first_name', 'last_name')
+EXPORT_CHUNK_SIZE = 500
+SNAPSHOT_VERSION = 1
+SNAPSHOT_APPS = ('users', 'recipes')
+SNAPSHOT_EXCLUDE = ('recipes.imageblob', 'recipes.recipetombstone')
+SNAPSHOT_NULL = '\\N'
+SNAPSHOT_MANIFEST = 'manifest.json'
+SNAPSHOT_CHUNK_SIZE = 2000
+SNAPSHOT_BATCH_SIZE = 5000
+SNAPSHOT_NATURAL_KEYS = {
+    'users.user': ('email',),
+    'recipes.tag': ('slug',),
+    'recipes.ingredient': ('name', 'measurement_unit'),
+}
+BATCH_MAX_REQUESTS = 10
+BATCH_PATH_PREFIX = '/api/'
+BATCH_STREAMING_VIEWS = ('recipes-export',)
+NORMALIZED_FORMAT = 'normalized'
+NORMALIZED_ACTIONS = ('list', 'by_ingredients', 'similar', 'changes')
+RECIPE_SYNC_TOKEN = '{moment}-{id}'
+LOAD_SHED_RETRY_AFTER = 1
+SQLITE_PROGRESS_STEPS = 10000
+FACETS_PARAM = 'facets'
+FACETS = ('tags',)
+RECIPE_FACETS_KEY = 'recipe_facets:{catalog}:{recipes}:{filters}'
+RECIPE_FACETS_VERSION_KEY = 'recipe_facets_version'
+RECIPE_FACETS_TIMEOUT = 60 * 5
+FACET_USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+DELETE_BATCH_SIZE = 500
+DELETE_SYNC_MAX = 2000
@@ -0,0 +1,192 @@
+"""
+Быстрое удаление рецептов и пользователей.
+
+Collector Django перед удалением читает в память каждую зависимую
+строку (ингредиенты рецептов, избранное, списки покупок, подписки),
+потому что на RecipeIngredient, Recipe и Token висят обработчики
+post_delete, и вызывает их по одной строке. Здесь каскад выполняется
+в базе: для каждой связи CASCADE — один DELETE ... WHERE fk IN
+(подзапрос), от зависимых таблиц к удаляемой, для SET_NULL — один
+UPDATE. Корневые строки удаляются пачками по DELETE_BATCH_SIZE, каждая
+пачка в своей транзакции, поэтому блокировки держатся недолго.
+
+Модели без обработчиков удаления и без зависимых связей удаляются
+обычным QuerySet.delete(): Collector выполняет для них один DELETE.
+Остальные (рецепты, пользователи, токены, ингредиенты рецептов) —
+DELETE по id пачками через курсор: сигналы при этом не отправляются,
+их работу для целой пачки сразу делают функции DELETE_HOOKS (отметки
+об удалении рецептов, счётчики ссылок на изображения, кеши фрагментов,
+фасетов и токенов).
+"""
+from collections import Counter, defaultdict
+
+from django.db import connections, models, router, transaction
+from django.db.models import F
+from django.db.models.deletion import Collector
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.cache import (
+    bump_recipe_facets_version,
+    invalidate_recipe_fragments,
+    record_recipe_changes,
+)
+from api.constans import DELETE_BATCH_SIZE
+from recipes.models import ImageBlob, Recipe, RecipeTombstone
+from recipes.signals import stamp_after_commit
+from recipes.storage import is_hashed
+
+
+def recipes_deleted(recipes):
+    """То же, что обработчики post_delete рецепта, для всей пачки."""
+    rows = list(recipes.values_list('pk', 'image'))
+    recipe_ids = [pk for pk, _ in rows]
+    RecipeTombstone.objects.filter(recipe_id__in=recipe_ids).delete()
+    RecipeTombstone.objects.bulk_create(
+        RecipeTombstone(recipe_id=pk) for pk in recipe_ids
+    )
+    stamp_after_commit(
+        RecipeTombstone.objects.filter(recipe_id__in=recipe_ids), 'deleted_at'
+    )
+    release_images(Counter(image for _, image in rows if is_hashed(image)))
+    invalidate_recipe_fragments(recipe_ids)
+    record_recipe_changes(recipe_ids)
+    bump_recipe_facets_version()
+
+
+def release_images(references):
+    """Уменьшить счётчики ссылок: один UPDATE на каждое значение счётчика."""
+    names = defaultdict(list)
+    for name, count in references.items():
+        names[count].append(name)
+    for count, group in names.items():
+        ImageBlob.objects.filter(name__in=group).update(
+            refcount=F('refcount') - count, touched=timezone.now()
+        )
+
+
+def tokens_deleted(tokens):
+    invalidate_tokens(list(tokens.values_list('key', flat=True)))
+
+
+DELETE_HOOKS = {
+    Recipe: recipes_deleted,
+    Token: tokens_deleted,
+}
+
+
+def dependents(queryset):
+    """Связи, которые ссылаются на строки queryset, и их строки."""
+    for relation in queryset.model._meta.get_fields(include_hidden=True):
+        if not relation.auto_created or relation.concrete or not (
+            relation.one_to_many or relation.one_to_one
+        ):
+            continue
+        yield relation, relation.related_model._base_manager.using(
+            queryset.db
+        ).filter(**{f'{relation.field.name}__in': queryset})
+
+
+def cascade_delete(queryset):
+    """
+    Удалить строки queryset вместе со всеми строками, которые ссылаются
+    на них через CASCADE. Возвращает число удалённых строк по моделям.
+    """
+    model = queryset.model
+    deleted = Counter()
+    for relation, related in dependents(queryset):
+        if relation.on_delete is models.CASCADE:
+            deleted.update(cascade_delete(related))
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+        elif relation.on_delete is not models.DO_NOTHING:
+            raise ValueError(
+                f'{relation.related_model._meta.label}.{relation.field.name}'
+                f': {relation.on_delete.__name__} не поддерживается.'
+            )
+    hook = DELETE_HOOKS.get(model)
+    if hook is not None:
+        hook(queryset)
+    if Collector(using=queryset.db).can_fast_delete(queryset):
+        deleted[model._meta.label] += queryset.delete()[0]
+    else:
+        deleted[model._meta.label] += delete_by_pk(queryset)
+    return deleted
+
+
+def delete_by_pk(queryset):
+    """
+    DELETE по id строк queryset пачками по DELETE_BATCH_SIZE, без
+    Collector и сигналов: зависимые строки к этому моменту уже удалены.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    quote = connection.ops.quote_name
+    pks = list(queryset.values_list('pk', flat=True))
+    count = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(pks), DELETE_BATCH_SIZE):
+            batch = pks[start:start + DELETE_BATCH_SIZE]
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({})'.format(
+                    quote(model._meta.db_table),
+                    quote(model._meta.pk.column),
+                    ', '.join(['%s'] * len(batch)),
+                ),
+                batch,
+            )
+            count += cursor.rowcount
+    return count
+
+
+def cascade_count(queryset):
+    """Сколько строк каждой модели удалит cascade_delete."""
+    counts = Counter()
+    counts[queryset.model] = queryset.count()
+    for relation, related in dependents(queryset):
+        if relation.on_delete is models.CASCADE:
+            counts.update(cascade_count(related))
+    return +counts
+
+
+def fast_delete(*querysets, progress=None):
+    """
+    Удалить querysets по очереди пачками корневых строк.
+    progress(done, total) вызывается после каждой пачки.
+    """
+    batches = []
+    for queryset in querysets:
+        pks = list(queryset.values_list('pk', flat=True))
+        batches.extend(
+            (queryset.model, pks[start:start + DELETE_BATCH_SIZE])
+            for start in range(0, len(pks), DELETE_BATCH_SIZE)
+        )
+    total = sum(len(pks) for _, pks in batches)
+    deleted = Counter()
+    done = 0
+    for model, pks in batches:
+        using = router.db_for_write(model)
+        with transaction.atomic(using=using):
+            deleted.update(cascade_delete(
+                model._base_manager.using(using).filter(pk__in=pks)
+            ))
+        done += len(pks)
+        if progress is not None:
+            progress(done, total)
+    return deleted
+
+
+def delete_recipes(recipes, progress=None):
+    return fast_delete(recipes, progress=progress)
+
+
+def delete_users(users, progress=None):
+    """Сначала рецепты пользователей пачками, затем всё остальное."""
+    user_ids = list(users.values_list('pk', flat=True))
+    return fast_delete(
+        Recipe.objects.filter(author__in=user_ids),
+        users.model.objects.filter(pk__in=user_ids),
+        progress=progress,
+    )
@@ -0,0 +1,118 @@
+"""
+Сроки и ограничение параллельности для дорогих действий API.
+
+Срок SQL-запросов действует на все потоки HTTP-запроса через
+query_wrappers: и в потоке запроса, и в пуле database_sync_to_async.
+Он задаётся при первом обращении к каждому соединению: на PostgreSQL —
+statement_timeout, на SQLite — progress handler, который прерывает
+запрос после срока. Снимает его постоянная обёртка соединения перед
+первым SQL-запросом вне этого HTTP-запроса — в том же потоке, которому
+принадлежит соединение.
+
+Слоты параллельности — файлы в LOAD_SHED_DIR под flock: они общие для
+всех процессов и потоков машины, блокировку упавшего воркера снимает ОС.
+"""
+import fcntl
+import math
+import time
+
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from api.constans import SQLITE_PROGRESS_STEPS
+from foodgram.executors import request_wrappers
+
+
+class DeadlineExceeded(DatabaseError):
+    """Срок запроса истёк до очередного SQL-запроса."""
+
+
+class StatementDeadline:
+    """
+    execute_wrapper со сроком на все SQL-запросы одного HTTP-запроса.
+    Без start() запросы проходят без срока.
+    """
+
+    deadline = None
+
+    def start(self, seconds):
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def expired(self):
+        return self.deadline is not None and self.remaining() <= 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.deadline is None:
+            return execute(sql, params, many, context)
+        connection = context['connection']
+        if getattr(connection, 'statement_deadline', None) is not self:
+            self.apply(connection)
+        if self.expired():
+            raise DeadlineExceeded('Срок запроса истёк.')
+        return execute(sql, params, many, context)
+
+    def apply(self, connection):
+        if connection.vendor == 'postgresql':
+            with connection.connection.cursor() as cursor:
+                cursor.execute(
+                    'SET statement_timeout = %s',
+                    [max(math.ceil(self.remaining() * 1000), 1)],
+                )
+        elif connection.vendor == 'sqlite':
+            connection.connection.set_progress_handler(
+                self.interrupt, SQLITE_PROGRESS_STEPS
+            )
+        connection.statement_deadline = self
+
+    def interrupt(self):
+        """Ненулевой ответ прерывает текущий запрос SQLite."""
+        return int(self.expired())
+
+
+def reset_deadline(connection):
+    if connection.connection is not None:
+        if connection.vendor == 'postgresql':
+            with connection.connection.cursor() as cursor:
+                cursor.execute('RESET statement_timeout')
+        elif connection.vendor == 'sqlite':
+            connection.connection.set_progress_handler(None, 0)
+    connection.statement_deadline = None
+
+
+def release_stale_deadline(execute, sql, params, many, context):
+    """
+    Постоянная обёртка соединения: срок прошлого HTTP-запроса снимается
+    перед первым SQL-запросом, который выполняется не в нём.
+    """
+    connection = context['connection']
+    deadline = getattr(connection, 'statement_deadline', None)
+    if deadline is not None and deadline not in request_wrappers.get():
+        reset_deadline(connection)
+    return execute(sql, params, many, context)
+
+
+class ConcurrencyLimiter:
+    """Не больше limit одновременных запросов действия name на машине."""
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+
+    def acquire(self):
+        """Открытый файл занятого слота или None, если слотов нет."""
+        directory = Path(settings.LOAD_SHED_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        for slot in range(self.limit):
+            handle = open(directory / f'{self.name}.{slot}.lock', 'a')
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            return handle
+        return None
@@ -0,0 +1,226 @@
+import json
+import re
+import statistics
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+
+from rest_framework.authtoken.models import Token
+
+from api.middleware import QueryRecorder
+from foodgram.executors import query_wrappers
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+DEFAULT_COLLECTION = (
+    settings.BASE_DIR.parent
+    / 'postman-collection' / 'diploma.postman_collection.json'
+)
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+VARIABLE = re.compile(r'\{\{(\w+)\}\}')
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(int(round(len(values) * fraction)) - 1, 0)]
+
+
+class Command(BaseCommand):
+    """
+    Нагрузочные сценарии из Postman-коллекции на локальной базе.
+
+    Повторяются GET-запросы коллекции: запросы на запись меняют данные
+    и не дают воспроизводимых замеров.
+    """
+    help = 'Замер задержек, пропускной способности и числа SQL-запросов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', default=DEFAULT_COLLECTION)
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост p95 относительно базы.')
+        parser.add_argument('--only', default='',
+                            help='Регулярное выражение для имён сценариев.')
+        parser.add_argument('--save-baseline', action='store_true')
+
+    def collection_requests(self, items):
+        for item in items:
+            if 'item' in item:
+                yield from self.collection_requests(item['item'])
+            elif item['request']['method'] == 'GET':
+                yield item
+
+    def variables(self):
+        """Значения переменных коллекции по данным локальной базы."""
+        users = list(
+            User.objects.annotate(
+                activity=Count('carts', distinct=True)
+                + Count('follower', distinct=True)
+                + Count('favorites', distinct=True)
+            ).order_by('-activity')[:3]
+        )
+        tags = list(Tag.objects.all()[:3])
+        ingredient = Ingredient.objects.first()
+        recipe = Recipe.objects.annotate(
+            popularity=Count('favorites')
+        ).order_by('-popularity').first()
+        if len(users) < 3 or len(tags) < 3 or not recipe:
+            raise CommandError(
+                'Недостаточно данных, запустите generate_dataset.'
+            )
+        token, _ = Token.objects.get_or_create(user=users[0])
+        return {
+            'userId': users[0].id,
+            'secondUserId': users[1].id,
+            'thirdUserId': users[2].id,
+            'userToken': token.key,
+            'firstTagId': tags[0].id,
+            'secondTagSlug': tags[1].slug,
+            'thirdTagSlug': tags[2].slug,
+            'firstIndredientId': ingredient.id,
+            'ingredientNameFirstLatter': ingredient.name[:1],
+            'firstRecipeId': recipe.id,
+        }
+
+    def scenarios(self, collection, variables):
+        """Имя сценария, путь и заголовки для каждого GET-запроса."""
+        def render(value):
+            return VARIABLE.sub(
+                lambda match: str(variables.get(match[1], match[0])), value
+            )
+
+        scenarios = {}
+        for item in self.collection_requests(collection['item']):
+            request = item['request']
+            url = request['url']
+            path = '/' + '/'.join(filter(None, url['path'])) + '/'
+            query = [
+                (param['key'], render(param['value']))
+                for param in url.get('query', ())
+                if not param.get('disabled')
+            ]
+            if query:
+                path += '?' + urlencode(query)
+            headers = {}
+            auth = request.get('auth') or {}
+            if auth.get('type') == 'apikey':
+                fields = {
+                    field['key']: field['value'] for field in auth['apikey']
+                }
+                header = 'HTTP_' + fields['key'].upper().replace('-', '_')
+                headers[header] = render(fields['value'])
+            name = item['name']
+            number = 2
+            while name in scenarios:
+                name = f'{item["name"]} #{number}'
+                number += 1
+            scenarios[name] = (render(path), headers)
+        return scenarios
+
+    def client(self):
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if host != '*'),
+            'localhost',
+        )
+        return Client(HTTP_HOST=host.lstrip('.'))
+
+    def measure(self, path, headers, iterations, concurrency):
+        client = self.client()
+        client.get(path, **headers)
+        # Запросы всех баз (и реплики) из всех потоков, включая пул
+        # database_sync_to_async асинхронных представлений.
+        queries = QueryRecorder()
+        with query_wrappers(queries):
+            status = client.get(path, **headers).status_code
+        query_count = len(queries.queries)
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            client.get(path, **headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        def worker(_):
+            worker_client = self.client()
+            for _ in range(iterations):
+                worker_client.get(path, **headers)
+            connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            'status': status,
+            'queries': query_count,
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'rps': iterations * concurrency / elapsed,
+        }
+
+    def regressions(self, results, baseline, tolerance):
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                yield '{}: SQL-запросов {} вместо {}'.format(
+                    name, result['queries'], base['queries']
+                )
+            if result['p95'] > base['p95'] * (1 + tolerance):
+                yield '{}: p95 {:.1f} мс вместо {:.1f} мс'.format(
+                    name, result['p95'], base['p95']
+                )
+
+    def handle(self, *args, **options):
+        with open(options['collection'], encoding='utf8') as file:
+            collection = json.load(file)
+        only = re.compile(options['only'])
+        results = {}
+        for name, (path, headers) in self.scenarios(
+            collection, self.variables()
+        ).items():
+            if not only.search(name):
+                continue
+            result = self.measure(
+                path, headers, options['iterations'], options['concurrency']
+            )
+            results[name] = result
+            self.stdout.write(
+                '{name:<60} {status} SQL {queries:>3} '
+                'p50 {p50:7.1f} p95 {p95:7.1f} p99 {p99:7.1f} мс '
+                '{rps:8.1f} req/s'.format(name=name, **result)
+            )
+        baseline_path = Path(options['baseline'])
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(baseline_path, 'w', encoding='utf8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Базовые замеры сохранены в {baseline_path}.'
+            ))
+            return
+        try:
+            with open(baseline_path, encoding='utf8') as file:
+                baseline = json.load(file)
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING(
+                'Базовых замеров нет, сравнение пропущено.'
+            ))
+            return
+        regressions = list(
+            self.regressions(results, baseline, options['tolerance'])
+        )
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
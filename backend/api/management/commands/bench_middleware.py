@@ -0,0 +1,114 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import resolve
+
+DEFAULT_PATHS = (
+    '/api/tags/',
+    '/api/recipes/',
+    '/api/recipes/1/',
+    '/api/ingredients/',
+    '/api/users/',
+)
+STACKS = ('full', 'lean')
+
+
+class MiddlewareOnlyHandler(WSGIHandler):
+    """Вместо представления пустой ответ: остаётся только цепочка."""
+
+    def _get_response(self, request):
+        match = resolve(request.path_info)
+        for process_view in self._view_middleware:
+            response = process_view(
+                request, match.func, match.args, match.kwargs
+            )
+            if response is not None:
+                return response
+        return HttpResponse()
+
+
+class Command(BaseCommand):
+    """
+    Стоимость middleware на горячих GET-запросах API: один и тот же
+    запрос по очереди проходит через обработчик с полной цепочкой
+    (LEAN_API_MIDDLEWARE=False) и с урезанной для /api/. Отдельно
+    замеряется одна цепочка без представления: на дорогих запросах
+    разница тонет в разбросе времени самого представления.
+    """
+    help = 'Замер экономии от урезанной цепочки middleware для /api/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--token', default='')
+        parser.add_argument('--path', action='append', dest='paths')
+
+    def handler(self, handler_class, lean):
+        enabled = settings.LEAN_API_MIDDLEWARE
+        settings.LEAN_API_MIDDLEWARE = lean
+        try:
+            return handler_class()
+        finally:
+            settings.LEAN_API_MIDDLEWARE = enabled
+
+    def measure(self, handler, request):
+        started = time.perf_counter()
+        response = handler.get_response(request)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{request.path}: ответ {response.status_code}.'
+            )
+        response.close()
+        return elapsed
+
+    def compare(self, handler_class, factory, path, requests):
+        """Медианы времени запроса в микросекундах для каждой цепочки."""
+        handlers = {
+            stack: self.handler(handler_class, stack == 'lean')
+            for stack in STACKS
+        }
+        timings = {stack: [] for stack in STACKS}
+        for number in range(requests):
+            order = STACKS if number % 2 else STACKS[::-1]
+            for stack in order:
+                timings[stack].append(
+                    self.measure(handlers[stack], factory.get(path))
+                )
+        return [
+            statistics.median(timings[stack]) * 1000000 for stack in STACKS
+        ]
+
+    def handle(self, *args, **options):
+        host = next(
+            (host for host in settings.ALLOWED_HOSTS if host != '*'),
+            'localhost',
+        )
+        headers = {'HTTP_HOST': host.lstrip('.')}
+        if options['token']:
+            headers['HTTP_AUTHORIZATION'] = f'Token {options["token"]}'
+        factory = RequestFactory(**headers)
+        paths = options['paths'] or DEFAULT_PATHS
+        saved = []
+        for path in paths:
+            full, lean = self.compare(
+                MiddlewareOnlyHandler, factory, path, options['requests']
+            )
+            full_request, lean_request = self.compare(
+                WSGIHandler, factory, path, options['requests']
+            )
+            saved.append(full - lean)
+            self.stdout.write(
+                f'{path:<30} middleware {full:5.0f} -> {lean:5.0f} мкс '
+                f'(-{full - lean:.0f} мкс), запрос {full_request:7.0f} -> '
+                f'{lean_request:7.0f} мкс'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Экономия на запрос: {:.0f} мкс в среднем.'.format(
+                statistics.mean(saved)
+            )
+        ))
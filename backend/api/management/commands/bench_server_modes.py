@@ -0,0 +1,133 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+DEFAULT_PATHS = (
+    '/api/recipes/download_shopping_cart/',
+    '/api/ingredients/?name=%D0%B0',
+    '/api/users/subscriptions/',
+)
+SERVER_MODES = ('wsgi', 'asgi')
+
+
+def rss_kb(pid):
+    """Резидентная память процесса и его потомков в килобайтах."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as file:
+                pids.extend(int(child) for child in file.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+
+class Command(BaseCommand):
+    """
+    Сравнение пропускной способности gunicorn в режимах WSGI и ASGI
+    при одинаковом числе процессов.
+    """
+    help = 'Нагрузочное сравнение синхронного и ASGI-режимов сервера.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--port', type=int, default=7100)
+        parser.add_argument('--token', default='')
+        parser.add_argument('--path', action='append', dest='paths')
+
+    def start_server(self, mode, port, workers):
+        env = dict(os.environ, SERVER_MODE=mode)
+        process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '--config', 'gunicorn.conf.py',
+                '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers),
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), 1).close()
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise RuntimeError(f'Сервер {mode} не запустился.')
+
+    def fetch(self, url, token):
+        request = urllib.request.Request(url)
+        if token:
+            request.add_header('Authorization', f'Token {token}')
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                ok = response.status < 400
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - started, ok
+
+    def run_load(self, port, paths, total, concurrency, token):
+        urls = [
+            f'http://127.0.0.1:{port}{paths[number % len(paths)]}'
+            for number in range(total)
+        ]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(lambda url: self.fetch(url, token), urls))
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latency for latency, _ in results)
+        return {
+            'rps': total / elapsed,
+            'errors': sum(1 for _, ok in results if not ok),
+            'p50': statistics.median(latencies) * 1000,
+            'p95': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        }
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        for number, mode in enumerate(SERVER_MODES):
+            port = options['port'] + number
+            server = self.start_server(mode, port, options['workers'])
+            try:
+                self.run_load(
+                    port, paths, options['concurrency'],
+                    options['concurrency'], options['token'],
+                )
+                result = self.run_load(
+                    port, paths, options['requests'],
+                    options['concurrency'], options['token'],
+                )
+                result['rss'] = rss_kb(server.pid) / 1024
+            finally:
+                server.terminate()
+                server.wait()
+            self.stdout.write(
+                '{mode}: {rps:.1f} req/s, p50 {p50:.1f} ms, '
+                'p95 {p95:.1f} ms, ошибок {errors}, RSS {rss:.1f} MiB'.format(
+                    mode=mode, **result
+                )
+            )
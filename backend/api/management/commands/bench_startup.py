@@ -0,0 +1,86 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/users/',
+)
+STARTUP_SCRIPT = '''
+import json, os, sys, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+from foodgram.wsgi import application
+loaded = time.perf_counter()
+if sys.argv[1] == 'warm':
+    from foodgram.warmup import warm_up
+    warm_up()
+warmed = time.perf_counter()
+from django.conf import settings
+from django.test import Client
+host = next((h for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+client = Client(HTTP_HOST=host.lstrip('.'))
+first = {}
+for path in sys.argv[2:]:
+    moment = time.perf_counter()
+    client.get(path)
+    first[path] = (time.perf_counter() - moment) * 1000
+print(json.dumps({
+    'import': (loaded - started) * 1000,
+    'warmup': (warmed - loaded) * 1000,
+    'first': first,
+}))
+'''
+
+
+class Command(BaseCommand):
+    """
+    Время старта воркера: загрузка приложения, прогрев и первые
+    запросы в новом процессе, с прогревом и без него.
+    """
+    help = 'Замер времени старта и первых запросов с прогревом и без.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', action='append', dest='paths')
+
+    def run(self, mode, paths):
+        process = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT, mode, *paths],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, METRICS_ENABLED='False'),
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr)
+        return json.loads(process.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        for mode in ('cold', 'warm'):
+            results = [self.run(mode, paths) for _ in range(options['runs'])]
+            first = {
+                path: statistics.median(
+                    result['first'][path] for result in results
+                )
+                for path in paths
+            }
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '{}: загрузка {:.0f} мс, прогрев {:.0f} мс, '
+                'первые запросы {:.0f} мс'.format(
+                    mode,
+                    statistics.median(r['import'] for r in results),
+                    statistics.median(r['warmup'] for r in results),
+                    sum(first.values()),
+                )
+            ))
+            for path, duration in first.items():
+                self.stdout.write(f'   {path:<40} {duration:8.1f} мс')
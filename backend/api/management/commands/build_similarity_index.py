@@ -0,0 +1,29 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.cache import get_recipe_changes_seq
+from api.recipe_index import SimilarityIndex
+
+
+class Command(BaseCommand):
+    """
+    Полная перестройка MinHash-сигнатур рецептов. Снимок сохраняется
+    на диск, процессы при старте читают его и догоняют ленту изменений.
+    """
+    help = 'Перестроить индекс похожих рецептов.'
+
+    def handle(self, *args, **options):
+        seq = get_recipe_changes_seq()
+        index = SimilarityIndex()
+        started = time.perf_counter()
+        index.build()
+        index.save(seq)
+        self.stdout.write(self.style.SUCCESS(
+            'Сигнатуры {} рецептов за {:.1f} с сохранены в {}.'.format(
+                len(index.recipe_ids),
+                time.perf_counter() - started,
+                settings.SIMILARITY_INDEX_PATH,
+            )
+        ))
@@ -0,0 +1,50 @@
+import io
+import pstats
+
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+
+
+class Command(BaseCommand):
+    """
+    Сводка по профилям ProfilingMiddleware: самые затратные функции
+    во всех сохранённых запросах или в запросах одного действия.
+    """
+    help = 'Самые горячие функции по сохранённым профилям запросов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.PROFILING_DIR)
+        parser.add_argument('--action', default='',
+                            help='Часть имени, например RecipeViewSet.list.')
+        parser.add_argument('--sort', choices=SORT_KEYS, default='tottime')
+        parser.add_argument('--limit', type=int, default=30)
+        parser.add_argument('--output',
+                            help='Сохранить объединённый профиль в файл.')
+
+    def handle(self, *args, **options):
+        paths = sorted(
+            path for path in Path(options['dir']).glob('*.prof')
+            if options['action'] in path.name
+        )
+        if not paths:
+            raise CommandError('Профилей не найдено.')
+        actions = Counter(
+            path.stem.split('_', 1)[1].rsplit('_', 1)[0] for path in paths
+        )
+        for action, count in actions.most_common():
+            self.stdout.write(f'{action:<60} {count:>5}')
+        report = io.StringIO()
+        stats = pstats.Stats(*map(str, paths), stream=report)
+        if options['output']:
+            stats.dump_stats(options['output'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Объединённый профиль сохранён в {options["output"]}.'
+            ))
+        stats.strip_dirs().sort_stats(options['sort'])
+        stats.print_stats(options['limit'])
+        self.stdout.write(report.getvalue())
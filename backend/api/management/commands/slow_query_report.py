@@ -0,0 +1,85 @@
+import json
+import time
+
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Отчёт по журналу медленных запросов: отпечатки запросов
+    по убыванию суммарного времени, представления и план выполнения.
+    """
+    help = 'Самые затратные медленные SQL-запросы по журналу.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.SLOW_QUERY_LOG)
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--hours', type=float,
+                            help='Учитывать только последние N часов.')
+        parser.add_argument('--no-plan', action='store_true')
+
+    def read(self, path, since):
+        try:
+            with open(path, encoding='utf8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry['time'] >= since:
+                        yield entry
+        except FileNotFoundError:
+            raise CommandError(f'Журнал {path} не найден.')
+
+    def aggregate(self, entries):
+        fingerprints = {}
+        for entry in entries:
+            stats = fingerprints.setdefault(entry['fingerprint'], {
+                'sql': entry['sql'],
+                'count': 0,
+                'total': 0.0,
+                'max': 0.0,
+                'views': Counter(),
+                'plan': None,
+            })
+            stats['count'] += 1
+            stats['total'] += entry['ms']
+            stats['max'] = max(stats['max'], entry['ms'])
+            stats['views'][entry.get('view')] += 1
+            if entry.get('plan'):
+                stats['plan'] = entry['plan']
+        return sorted(
+            fingerprints.items(),
+            key=lambda item: item[1]['total'],
+            reverse=True,
+        )
+
+    def handle(self, *args, **options):
+        since = 0
+        if options['hours']:
+            since = time.time() - options['hours'] * 3600
+        ranked = self.aggregate(self.read(options['file'], since))
+        if not ranked:
+            self.stdout.write('Медленных запросов нет.')
+            return
+        for rank, (key, stats) in enumerate(
+            ranked[:options['limit']], start=1
+        ):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                '{}. {} всего {:.0f} мс, {} раз, среднее {:.1f} мс, '
+                'максимум {:.1f} мс'.format(
+                    rank, key, stats['total'], stats['count'],
+                    stats['total'] / stats['count'], stats['max'],
+                )
+            ))
+            self.stdout.write('   ' + ', '.join(
+                f'{view} ({count})'
+                for view, count in stats['views'].most_common()
+            ))
+            self.stdout.write('   ' + stats['sql'])
+            if stats['plan'] and not options['no_plan']:
+                for row in stats['plan']:
+                    self.stdout.write('     ' + row)
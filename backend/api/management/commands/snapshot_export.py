@@ -0,0 +1,41 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.constans import SNAPSHOT_CHUNK_SIZE
+from api.snapshot import SnapshotError, export_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Снимок пользователей и каталога рецептов в zip-архив с CSV по
+    таблицам. Файлы изображений в снимок не входят, их каталог media
+    переносится отдельно.
+    """
+    help = 'Выгрузить снимок каталога в архив.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--chunk-size', type=int, default=SNAPSHOT_CHUNK_SIZE
+        )
+
+    def report(self, model, count):
+        self.stdout.write(f'   {model:<32} {count:>12}')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            export_snapshot(
+                options['path'], options['chunk_size'], self.report
+            )
+        except SnapshotError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Снимок {} ({:.1f} МБ) записан за {:.1f} с.'.format(
+                options['path'],
+                os.path.getsize(options['path']) / 2 ** 20,
+                time.perf_counter() - started,
+            )
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.constans import SNAPSHOT_BATCH_SIZE
+from api.snapshot import SnapshotError, import_snapshot
+
+
+class Command(BaseCommand):
+    """
+    Загрузка снимка из snapshot_export. Без --append таблицы должны быть
+    пустыми, id сохраняются. С --append id сдвигаются, а пользователи,
+    теги и ингредиенты, которые уже есть в базе, не дублируются.
+    """
+    help = 'Загрузить снимок каталога из архива.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--append', action='store_true')
+        parser.add_argument(
+            '--batch-size', type=int, default=SNAPSHOT_BATCH_SIZE
+        )
+
+    def report(self, model, count):
+        self.stdout.write(f'   {model:<32} {count:>12}')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            import_snapshot(
+                options['path'],
+                options['append'],
+                options['batch_size'],
+                self.report,
+            )
+        except SnapshotError as error:
+            raise CommandError(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Снимок загружен за {:.1f} с. Счётчики ссылок на изображения '
+            'обновит gc_images --recount.'.format(
+                time.perf_counter() - started
+            )
+        ))
@@ -0,0 +1,288 @@
+"""
+Метрики приложения в формате Prometheus.
+
+Каждый процесс копит счётчики в памяти и раз в METRICS_FLUSH_INTERVAL
+секунд сбрасывает их в файл METRICS_DIR/<pid>-<boot>.json, где boot
+уникален для запуска процесса: новый воркер с тем же pid не затирает
+файл прежнего. Файлы завершившихся процессов переносятся в общий
+архив (при выходе процесса, из хука child_exit gunicorn и при сборке),
+поэтому счётчики не убывают. Эндпоинт метрик складывает архив и файлы
+живых процессов.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+from api.constans import METRICS_ARCHIVE, METRICS_FILE, METRICS_LOCK
+
+HELP = {
+    'foodgram_requests_total': ('counter', 'Запросы по действиям API.'),
+    'foodgram_request_duration_seconds': (
+        'histogram', 'Время ответа по действиям API.'
+    ),
+    'foodgram_response_size_bytes': (
+        'histogram', 'Размер ответа по действиям API.'
+    ),
+    'foodgram_db_duration_seconds': (
+        'histogram', 'Время в базе данных на запрос.'
+    ),
+    'foodgram_cache_requests_total': (
+        'counter', 'Обращения к кешам: попадания и промахи.'
+    ),
+    'foodgram_requests_shed_total': (
+        'counter', 'Отказы 503: нет свободного слота или истёк срок.'
+    ),
+}
+
+
+class MetricsRegistry:
+    """Счётчики и гистограммы одного процесса."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Пустой реестр: воркер не наследует метрики мастера."""
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+        self.boot = uuid.uuid4().hex
+
+    @staticmethod
+    def key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, labels, value=1):
+        if not settings.METRICS_ENABLED or not value:
+            return
+        with self.lock:
+            self.counters[self.key(name, labels)] += value
+        self.maybe_flush()
+
+    def observe(self, name, labels, value, buckets):
+        if not settings.METRICS_ENABLED:
+            return
+        with self.lock:
+            histogram = self.histograms.setdefault(
+                self.key(name, labels),
+                {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                 'sum': 0.0, 'count': 0},
+            )
+            for number, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][number] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [
+                    [name, list(labels), value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, list(labels), dict(
+                        histogram, counts=list(histogram['counts'])
+                    )]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def maybe_flush(self):
+        if (
+            time.monotonic() - self.flushed_at
+            >= settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / METRICS_FILE.format(
+            pid=os.getpid(), boot=self.boot
+        )
+        write_json(path, self.snapshot())
+
+
+registry = MetricsRegistry()
+inc = registry.inc
+observe = registry.observe
+os.register_at_fork(after_in_child=registry.reset)
+
+
+@atexit.register
+def flush_on_exit():
+    if settings.configured and settings.METRICS_ENABLED:
+        registry.flush()
+        mark_process_dead(os.getpid())
+
+
+def write_json(path, data):
+    temporary = path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(data))
+    temporary.replace(path)
+
+
+def read_json(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def locked(exclusive):
+    """Архив и файлы процессов меняются и читаются под flock."""
+    directory = Path(settings.METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / METRICS_LOCK, 'a') as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield directory
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def process_files(directory):
+    """Файлы процессов в виде (pid, путь)."""
+    for path in directory.glob('*.json'):
+        pid = path.stem.partition('-')[0]
+        if path.name != METRICS_ARCHIVE and pid.isdigit():
+            yield int(pid), path
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def archive(is_dead):
+    """Перенести в архив файлы процессов, для pid которых is_dead."""
+    with locked(exclusive=True) as directory:
+        dead = [
+            path for pid, path in process_files(directory) if is_dead(pid)
+        ]
+        if not dead:
+            return
+        counters, histograms = defaultdict(float), {}
+        for path in [directory / METRICS_ARCHIVE, *dead]:
+            add(counters, histograms, read_json(path))
+        write_json(directory / METRICS_ARCHIVE, {
+            'counters': [
+                [name, list(labels), value]
+                for (name, labels), value in counters.items()
+            ],
+            'histograms': [
+                [name, list(labels), histogram]
+                for (name, labels), histogram in histograms.items()
+            ],
+        })
+        for path in dead:
+            path.unlink()
+
+
+def mark_process_dead(pid):
+    """Метрики завершившегося процесса pid — в архив."""
+    archive(lambda other: other == pid)
+
+
+def add(counters, histograms, data):
+    if data is None:
+        return
+    for name, labels, value in data['counters']:
+        counters[name, tuple(map(tuple, labels))] += value
+    for name, labels, histogram in data['histograms']:
+        key = name, tuple(map(tuple, labels))
+        total = histograms.setdefault(key, {
+            'buckets': histogram['buckets'],
+            'counts': [0] * len(histogram['buckets']),
+            'sum': 0.0, 'count': 0,
+        })
+        total['counts'] = [
+            left + right
+            for left, right in zip(total['counts'], histogram['counts'])
+        ]
+        total['sum'] += histogram['sum']
+        total['count'] += histogram['count']
+
+
+def collect():
+    """
+    Сумма архива и метрик живых процессов, включая несброшенные данные
+    текущего. Файлы процессов, которые завершились без хука (SIGKILL),
+    сначала переносятся в архив.
+    """
+    registry.flush()
+    archive(lambda pid: not is_alive(pid))
+    counters = defaultdict(float)
+    histograms = {}
+    with locked(exclusive=False) as directory:
+        add(counters, histograms, read_json(directory / METRICS_ARCHIVE))
+        for _, path in process_files(directory):
+            add(counters, histograms, read_json(path))
+    return counters, histograms
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(
+        '{}="{}"'.format(
+            key, str(value).replace('\\', r'\\').replace('"', r'\"')
+        )
+        for key, value in pairs
+    )
+
+
+def render_prometheus():
+    """Текстовый формат экспозиции Prometheus 0.0.4."""
+    counters, histograms = collect()
+    lines = []
+    for name, (kind, description) in HELP.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f'{name}{format_labels(labels)} {value:g}')
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(
+                histogram['buckets'], histogram['counts']
+            ):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels(labels, le=f'{bound:g}'), cumulative
+                ))
+            lines.append('{}_bucket{} {}'.format(
+                name, format_labels(labels, le='+Inf'), histogram['count']
+            ))
+            lines.append(
+                f'{name}_sum{format_labels(labels)} {histogram["sum"]:g}'
+            )
+            lines.append(
+                f'{name}_count{format_labels(labels)} {histogram["count"]}'
+            )
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,421 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError
+from django.http import JsonResponse
+
+from rest_framework.exceptions import APIException
+
+from api import metrics
+from api.authentication import CachedTokenAuthentication
+from api.constans import (
+    LATENCY_BUCKETS,
+    LOAD_SHED_RETRY_AFTER,
+    PROFILE_HEADER,
+    PROFILE_NAME,
+    SIZE_BUCKETS,
+    SLOWEST_QUERIES_LOGGED,
+)
+from api.limits import ConcurrencyLimiter, StatementDeadline
+from api.slow_queries import SlowQueryLogger
+from foodgram.executors import query_wrappers
+from foodgram.middleware import DualModeMiddleware
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше SQL-запросов, чем разрешено."""
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, запоминающая запросы и их длительность."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @staticmethod
+    def shape(sql):
+        """Форма запроса: списки IN разной длины считаются одинаковыми."""
+        return IN_LIST.sub('IN (...)', sql)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, duration in self.queries)
+
+    def slowest(self, count):
+        return sorted(
+            self.queries, key=lambda query: query[1], reverse=True
+        )[:count]
+
+    def duplicates(self):
+        shapes = Counter(self.shape(sql) for sql, _ in self.queries)
+        return {sql: count for sql, count in shapes.items() if count > 1}
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else None
+
+
+def action_labels(request):
+    """Класс представления и действие DRF, например RecipeViewSet/list."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return {'view': 'unresolved', 'action': ''}
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return {'view': match.view_name or match.func.__name__, 'action': ''}
+    method = request.method.lower()
+    actions = getattr(match.func, 'actions', None) or {}
+    return {
+        'view': view_class.__name__,
+        'action': actions.get(method, method),
+    }
+
+
+class QueryInstrumentationMiddleware(DualModeMiddleware):
+    """
+    Число SQL-запросов, время в базе, самые медленные и повторяющиеся
+    запросы для каждого запроса к API.
+
+    Включается SQL_INSTRUMENTATION=True; выключенная прослойка удаляется
+    из цепочки при старте. Итоги попадают в заголовок Server-Timing
+    и в лог, превышение SQL_QUERY_BUDGETS даёт предупреждение или
+    исключение (SQL_QUERY_BUDGET_ACTION). Запросы считаются в любом
+    потоке, в том числе в пуле database_sync_to_async режима ASGI.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with query_wrappers(recorder):
+            response = self.get_response(request)
+        return self.report(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with query_wrappers(recorder):
+            response = await self.get_response(request)
+        return self.report(request, response, recorder, started)
+
+    def report(self, request, response, recorder, started):
+        total = time.perf_counter() - started
+        name = view_name(request)
+        db_time = recorder.total_time
+        duplicates = recorder.duplicates()
+        response['Server-Timing'] = (
+            'db;dur={:.1f};desc="{} queries", app;dur={:.1f}'.format(
+                db_time * 1000, len(recorder.queries),
+                (total - db_time) * 1000,
+            )
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': name,
+            'status': response.status_code,
+            'queries': len(recorder.queries),
+            'db_ms': round(db_time * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'slowest': [
+                {'sql': sql, 'ms': round(duration * 1000, 2)}
+                for sql, duration in recorder.slowest(SLOWEST_QUERIES_LOGGED)
+            ],
+            'duplicates': duplicates,
+        }, ensure_ascii=False))
+        self.check_budget(name, len(recorder.queries))
+        return response
+
+    def check_budget(self, name, count):
+        budget = settings.SQL_QUERY_BUDGETS.get(name)
+        if budget is None or count <= budget:
+            return
+        message = f'{name}: {count} SQL-запросов при бюджете {budget}.'
+        if settings.SQL_QUERY_BUDGET_ACTION == 'raise':
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+
+
+class MetricsMiddleware(DualModeMiddleware):
+    """
+    Число запросов, время ответа, размер ответа и время в базе
+    по действиям API. Время в базе считается во всех потоках запроса,
+    как в QueryInstrumentationMiddleware. Выключается METRICS_ENABLED=False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with query_wrappers(recorder):
+            response = self.get_response(request)
+        return self.observe(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with query_wrappers(recorder):
+            response = await self.get_response(request)
+        return self.observe(request, response, recorder, started)
+
+    def observe(self, request, response, recorder, started):
+        duration = time.perf_counter() - started
+        labels = action_labels(request)
+        metrics.inc('foodgram_requests_total', dict(
+            labels, method=request.method, status=response.status_code
+        ))
+        metrics.observe(
+            'foodgram_request_duration_seconds', labels, duration,
+            LATENCY_BUCKETS,
+        )
+        metrics.observe(
+            'foodgram_db_duration_seconds', labels, recorder.total_time,
+            LATENCY_BUCKETS,
+        )
+        if not response.streaming:
+            metrics.observe(
+                'foodgram_response_size_bytes', labels,
+                len(response.content), SIZE_BUCKETS,
+            )
+        return response
+
+
+def release_after(content, slot):
+    """Слот потокового ответа освобождается, когда ответ отдан целиком."""
+    try:
+        yield from content
+    finally:
+        slot.close()
+
+
+class LoadSheddingMiddleware(DualModeMiddleware):
+    """
+    Сроки и ограничение параллельности дорогих действий API.
+
+    STATEMENT_TIMEOUTS задаёт срок SQL-запросов действия в секундах,
+    CONCURRENCY_LIMITS — число одновременных запросов действия на машине.
+    Без свободного слота и по истечении срока ответ 503 с Retry-After,
+    отказы считаются в foodgram_requests_shed_total. Срок действует и на
+    запросы к базе из пула database_sync_to_async. Выключается
+    LOAD_SHEDDING=False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.LOAD_SHEDDING:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.limiters = {
+            name: ConcurrencyLimiter(name, limit)
+            for name, limit in settings.CONCURRENCY_LIMITS.items()
+        }
+
+    def handle(self, request):
+        with ExitStack() as stack:
+            self.prepare(request, stack)
+            return self.finish(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        with ExitStack() as stack:
+            self.prepare(request, stack)
+            return self.finish(request, await self.get_response(request))
+
+    @staticmethod
+    def prepare(request, stack):
+        """
+        Срок подключается ко всем потокам запроса заранее, а включается
+        в process_view, когда известно действие: под ASGI process_view
+        выполняется в другом потоке и контексте.
+        """
+        request.shedding = stack
+        request.deadline = StatementDeadline()
+        stack.enter_context(query_wrappers(request.deadline))
+
+    @staticmethod
+    def finish(request, response):
+        slot = getattr(request, 'concurrency_slot', None)
+        if slot is not None and response.streaming:
+            response.streaming_content = release_after(
+                response.streaming_content, slot
+            )
+            request.concurrency_slot = None
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        name = view_name(request)
+        limiter = self.limiters.get(name)
+        if limiter is not None:
+            request.concurrency_slot = limiter.acquire()
+            if request.concurrency_slot is None:
+                return self.shed(request, 'concurrency')
+            request.shedding.callback(self.release, request)
+        timeout = settings.STATEMENT_TIMEOUTS.get(name)
+        if timeout:
+            request.deadline.start(timeout)
+        return None
+
+    def process_exception(self, request, exception):
+        deadline = getattr(request, 'deadline', None)
+        if (
+            deadline is not None
+            and isinstance(exception, DatabaseError)
+            and deadline.expired()
+        ):
+            return self.shed(request, 'timeout')
+        return None
+
+    @staticmethod
+    def release(request):
+        if request.concurrency_slot is not None:
+            request.concurrency_slot.close()
+
+    @staticmethod
+    def shed(request, reason):
+        metrics.inc(
+            'foodgram_requests_shed_total',
+            dict(action_labels(request), reason=reason),
+        )
+        response = JsonResponse(
+            {'detail': (
+                'Запрос выполнялся слишком долго, повторите его позже.'
+                if reason == 'timeout'
+                else 'Сервер перегружен, повторите запрос позже.'
+            )},
+            status=503,
+            json_dumps_params={'ensure_ascii': False},
+        )
+        response['Retry-After'] = LOAD_SHED_RETRY_AFTER
+        return response
+
+
+class SlowQueryMiddleware(DualModeMiddleware):
+    """
+    Журнал запросов к базе дольше SLOW_QUERY_THRESHOLD_MS с планами
+    выполнения, из любого потока запроса. Включается
+    SLOW_QUERY_LOGGING=True.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOGGING:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    @staticmethod
+    def logger(request):
+        def source():
+            labels = action_labels(request)
+            return {
+                'view': '{view}.{action}'.format(**labels),
+                'path': request.get_full_path(),
+            }
+
+        return SlowQueryLogger(source)
+
+    def handle(self, request):
+        with query_wrappers(self.logger(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with query_wrappers(self.logger(request)):
+            return await self.get_response(request)
+
+
+class ProfilingMiddleware(DualModeMiddleware):
+    """
+    Выборочное профилирование запросов через cProfile.
+
+    Профилируется доля PROFILING_SAMPLE_RATE запросов и любой запрос
+    администратора с заголовком X-Profile. Результат в формате pstats
+    сохраняется в PROFILING_DIR, в имени файла есть действие API;
+    старые файлы сверх PROFILING_MAX_FILES удаляются. Профиль снимается
+    в одном потоке, поэтому под ASGI Django вызывает его синхронно.
+    """
+
+    async_capable = False
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.directory = Path(settings.PROFILING_DIR)
+
+    @staticmethod
+    def is_staff_request(request):
+        if PROFILE_HEADER not in request.META:
+            return False
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return True
+        try:
+            authenticated = CachedTokenAuthentication().authenticate(request)
+        except APIException:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    def should_profile(self, request):
+        return (
+            random.random() < settings.PROFILING_SAMPLE_RATE
+            or self.is_staff_request(request)
+        )
+
+    def handle(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        labels = action_labels(request)
+        name = PROFILE_NAME.format(
+            time=int(time.time() * 1000),
+            view=labels['view'],
+            action=labels['action'] or request.method.lower(),
+            pid=os.getpid(),
+        )
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.directory / name)
+        self.rotate()
+        response['X-Profile'] = name
+        return response
+
+    def rotate(self):
+        """Оставить только PROFILING_MAX_FILES свежих профилей."""
+        profiles = sorted(
+            self.directory.glob('*.prof'),
+            key=lambda path: path.name,
+            reverse=True,
+        )
+        for path in profiles[settings.PROFILING_MAX_FILES:]:
+            path.unlink(missing_ok=True)
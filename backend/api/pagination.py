@@ -1,6 +1,6 @@
 from rest_framework.pagination import PageNumberPagination
 
-from foodgram.constants import PAGE_SIZE
+from foodgram.constants import MAX_PAGE_SIZE, PAGE_SIZE
 
 
 class PageLimitPagination(PageNumberPagination):
@@ -8,3 +8,4 @@ class PageLimitPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
+    max_page_size = MAX_PAGE_SIZE
@@ -0,0 +1,443 @@
+"""
+Индексы рецептов в памяти процесса.
+
+Индекс строится из базы один раз (в мастере gunicorn до fork
+или при первом запросе) и догоняет общую ленту изменений рецептов
+из кеша: изменённые рецепты перечитываются из базы и попадают
+в небольшую дельту поверх основных массивов NumPy.
+"""
+import itertools
+import threading
+import time
+
+from pathlib import Path
+
+from django.conf import settings
+
+import numpy as np
+
+from api.cache import get_recipe_changes, get_recipe_changes_seq
+from api.constans import (
+    INGREDIENT_INDEX_MAX_DELTA,
+    LSH_BANDS,
+    LSH_BUCKET_LIMIT,
+    MINHASH_CHUNK,
+    MINHASH_PERMUTATIONS,
+    MINHASH_PRIME,
+    MINHASH_SEED,
+    RECIPE_CHANGES_GRACE,
+    SIMILARITY_INDEX_MAX_DELTA,
+    SPARSE_QUERY_RATIO,
+)
+from recipes.models import RecipeIngredient
+
+
+def load_ingredient_pairs(recipe_ids=None):
+    """Пары (рецепт, ингредиент) массивом NumPy, по возрастанию рецепта."""
+    pairs = RecipeIngredient.objects.order_by('recipe_id').values_list(
+        'recipe_id', 'ingredient_id'
+    )
+    if recipe_ids is not None:
+        pairs = pairs.filter(recipe_id__in=recipe_ids)
+    return np.fromiter(
+        itertools.chain.from_iterable(pairs.iterator(chunk_size=10000)),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+
+
+def load_ingredient_sets(recipe_ids):
+    """Составы рецептов {id: frozenset(id ингредиентов)}."""
+    sets = {recipe_id: set() for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in load_ingredient_pairs(recipe_ids):
+        sets[int(recipe_id)].add(int(ingredient_id))
+    return {
+        recipe_id: frozenset(ingredients)
+        for recipe_id, ingredients in sets.items()
+    }
+
+
+class RecipeIndex:
+    """Основа индекса: построение и чтение ленты изменений."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.seq = None
+        self.stalled_since = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def apply(self, recipe_ids):
+        raise NotImplementedError
+
+    def refresh(self):
+        """Догнать ленту изменений; при разрыве ленты — перестроить."""
+        with self.lock:
+            current = get_recipe_changes_seq()
+            if self.seq == current:
+                return
+            if self.seq is None:
+                self.rebuild(current)
+                return
+            seq, recipe_ids = get_recipe_changes(self.seq, current)
+            if recipe_ids is None:
+                self.rebuild(current)
+                return
+            if recipe_ids:
+                self.apply(recipe_ids)
+            if seq < current:
+                # Запись ленты могла ещё не дойти до кеша или потеряться.
+                if self.stalled_since is None:
+                    self.stalled_since = time.monotonic()
+                elif (
+                    time.monotonic() - self.stalled_since
+                    > RECIPE_CHANGES_GRACE
+                ):
+                    self.rebuild(current)
+                    return
+            else:
+                self.stalled_since = None
+            self.seq = seq
+
+    def rebuild(self, seq):
+        self.build()
+        self.seq = seq
+        self.stalled_since = None
+
+
+class Ranking:
+    """
+    Результаты поиска в порядке убывания покрытия, возрастания числа
+    недостающих ингредиентов и убывания id. Массивы покрывают весь
+    индекс, неподходящие рецепты помечены покрытием -1 и не считаются.
+    Сортируется только запрошенная часть.
+    """
+
+    def __init__(self, recipe_ids, coverage, missing, count):
+        self.recipe_ids = recipe_ids
+        self.coverage = coverage
+        self.missing = missing
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, page):
+        needed = min(page.stop, self.count)
+        if not needed:
+            return []
+        keys = (
+            lambda positions: -self.coverage[positions],
+            lambda positions: self.missing[positions],
+            lambda positions: -self.recipe_ids[positions],
+        )
+        candidates = None
+        selected = []
+        # Первые needed отбираются без полной сортировки: строго лучшие
+        # по ключу берутся сразу, среди равных решает следующий ключ.
+        for key in keys:
+            values = key(slice(None) if candidates is None else candidates)
+            if needed >= len(values):
+                break
+            threshold = np.partition(values, needed - 1)[needed - 1]
+            better = np.flatnonzero(values < threshold)
+            ties = np.flatnonzero(values == threshold)
+            if candidates is not None:
+                better, ties = candidates[better], candidates[ties]
+            selected.append(better)
+            needed -= len(better)
+            candidates = ties
+        if candidates is None:
+            candidates = np.arange(len(self.recipe_ids))
+        selected.append(candidates)
+        candidates = np.concatenate(selected)
+        order = candidates[np.lexsort(tuple(
+            key(candidates) for key in reversed(keys)
+        ))]
+        return [
+            (
+                int(self.recipe_ids[position]),
+                round(float(self.coverage[position]), 4),
+                int(self.missing[position]),
+            )
+            for position in order[page]
+        ]
+
+
+class IngredientIndex(RecipeIndex):
+    """
+    Обратный индекс ингредиент → рецепты для поиска по продуктам.
+
+    Для каждого ингредиента хранится массив позиций рецептов, подсчёт
+    совпадений — один np.bincount по объединению массивов запроса.
+    """
+
+    def build(self):
+        pairs = load_ingredient_pairs()
+        self.recipe_ids, positions, sizes = np.unique(
+            pairs[:, 0], return_inverse=True, return_counts=True
+        )
+        self.sizes = sizes.astype(np.int32)
+        order = np.argsort(pairs[:, 1], kind='stable')
+        ingredients, starts = np.unique(
+            pairs[order, 1], return_index=True
+        )
+        self.postings = dict(zip(
+            ingredients.tolist(),
+            np.split(positions[order].astype(np.int32), starts[1:]),
+        ))
+        self.alive = np.ones(len(self.recipe_ids), dtype=bool)
+        self.delta = {}
+
+    def apply(self, recipe_ids):
+        positions = np.searchsorted(self.recipe_ids, sorted(recipe_ids))
+        positions = positions[positions < len(self.recipe_ids)]
+        positions = positions[
+            np.isin(self.recipe_ids[positions], list(recipe_ids))
+        ]
+        self.alive[positions] = False
+        for recipe_id, ingredients in load_ingredient_sets(
+            recipe_ids
+        ).items():
+            if ingredients:
+                self.delta[recipe_id] = ingredients
+            else:
+                self.delta.pop(recipe_id, None)
+        if len(self.delta) > INGREDIENT_INDEX_MAX_DELTA:
+            self.build()
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Рецепты, в которых есть хотя бы один из ингредиентов."""
+        self.refresh()
+        query = frozenset(ingredient_ids)
+        with self.lock:
+            postings = [
+                self.postings[ingredient_id]
+                for ingredient_id in query
+                if ingredient_id in self.postings
+            ]
+            positions = np.concatenate(postings or [np.empty(0, np.int32)])
+            if len(positions) * SPARSE_QUERY_RATIO < len(self.recipe_ids):
+                # Редкие ингредиенты: работа только с найденными рецептами.
+                positions, matched = np.unique(positions, return_counts=True)
+                alive = self.alive[positions]
+                positions, matched = positions[alive], matched[alive]
+                sizes = self.sizes[positions]
+                recipe_ids = self.recipe_ids[positions]
+                valid = np.ones(len(positions), dtype=bool)
+            else:
+                matched = np.bincount(
+                    positions, minlength=len(self.recipe_ids)
+                )
+                valid = (matched > 0) & self.alive
+                sizes = self.sizes
+                recipe_ids = self.recipe_ids
+            delta = [
+                (recipe_id, len(ingredients & query), len(ingredients))
+                for recipe_id, ingredients in self.delta.items()
+                if not ingredients.isdisjoint(query)
+            ]
+        if delta:
+            delta_ids, delta_matched, delta_sizes = map(np.array, zip(*delta))
+            recipe_ids = np.concatenate((recipe_ids, delta_ids))
+            matched = np.concatenate((matched, delta_matched))
+            sizes = np.concatenate((sizes, delta_sizes))
+            valid = np.concatenate((valid, np.ones(len(delta), dtype=bool)))
+        missing = sizes - matched
+        if max_missing is not None:
+            valid &= missing <= max_missing
+        coverage = np.where(valid, matched / np.maximum(sizes, 1), -1.0)
+        return Ranking(
+            recipe_ids, coverage, missing, int(np.count_nonzero(valid))
+        )
+
+
+class SimilarityIndex(RecipeIndex):
+    """
+    Похожие по составу рецепты: MinHash-сигнатуры и LSH.
+
+    Сигнатура рецепта — минимумы MINHASH_PERMUTATIONS хеш-функций
+    по его ингредиентам, доля совпадающих позиций двух сигнатур
+    оценивает коэффициент Жаккара. Сигнатура режется на LSH_BANDS
+    полос, кандидаты — рецепты, совпавшие хотя бы в одной полосе.
+    Для каждой полосы хранятся отсортированные ключи и позиции рецептов.
+    """
+
+    def __init__(self):
+        super().__init__()
+        random = np.random.default_rng(MINHASH_SEED)
+        self.hash_a = random.integers(
+            1, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.int64
+        )
+        self.hash_b = random.integers(
+            0, MINHASH_PRIME, MINHASH_PERMUTATIONS, dtype=np.int64
+        )
+        self.band_multipliers = random.integers(
+            1, 2 ** 63, MINHASH_PERMUTATIONS // LSH_BANDS, dtype=np.uint64
+        )
+
+    def hashes(self, ingredient_ids):
+        """Значения всех хеш-функций для ингредиентов: строка на каждый."""
+        ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+        return (
+            (ingredient_ids[:, None] * self.hash_a + self.hash_b)
+            % MINHASH_PRIME
+        ).astype(np.uint32)
+
+    def signatures(self, pairs):
+        """id рецептов и их сигнатуры по парам (рецепт, ингредиент)."""
+        recipe_ids, starts = np.unique(pairs[:, 0], return_index=True)
+        signatures = np.empty(
+            (len(recipe_ids), MINHASH_PERMUTATIONS), dtype=np.uint32
+        )
+        if not len(recipe_ids):
+            return recipe_ids, signatures
+        table = self.hashes(np.arange(pairs[:, 1].max() + 1))
+        bounds = np.append(starts, len(pairs))
+        for first in range(0, len(recipe_ids), MINHASH_CHUNK):
+            last = min(first + MINHASH_CHUNK, len(recipe_ids))
+            rows = pairs[bounds[first]:bounds[last], 1]
+            signatures[first:last] = np.minimum.reduceat(
+                table[rows], starts[first:last] - bounds[first], axis=0
+            )
+        return recipe_ids, signatures
+
+    def band_keys(self, signatures):
+        """Ключ каждой полосы сигнатуры: число размером 32 бита."""
+        bands = signatures.reshape(
+            len(signatures), LSH_BANDS, MINHASH_PERMUTATIONS // LSH_BANDS
+        ).astype(np.uint64)
+        keys = (bands * self.band_multipliers).sum(axis=2)
+        return (keys ^ (keys >> np.uint64(32))).astype(np.uint32)
+
+    def build(self):
+        self.set_arrays(*self.signatures(load_ingredient_pairs()))
+
+    def set_arrays(self, recipe_ids, signatures):
+        self.recipe_ids = recipe_ids
+        self.signature_matrix = signatures
+        keys = self.band_keys(signatures)
+        self.band_positions = np.argsort(keys, axis=0, kind='stable').astype(
+            np.int32
+        ).T.copy()
+        self.band_sorted = np.take_along_axis(
+            keys, self.band_positions.T, axis=0
+        ).T.copy()
+        self.alive = np.ones(len(recipe_ids), dtype=bool)
+        self.delta = {}
+
+    def apply(self, recipe_ids):
+        positions = np.searchsorted(self.recipe_ids, sorted(recipe_ids))
+        positions = positions[positions < len(self.recipe_ids)]
+        positions = positions[
+            np.isin(self.recipe_ids[positions], list(recipe_ids))
+        ]
+        self.alive[positions] = False
+        for recipe_id, ingredients in load_ingredient_sets(
+            recipe_ids
+        ).items():
+            if ingredients:
+                self.delta[recipe_id] = self.hashes(sorted(ingredients)).min(
+                    axis=0
+                )
+            else:
+                self.delta.pop(recipe_id, None)
+        if len(self.delta) > SIMILARITY_INDEX_MAX_DELTA:
+            self.build()
+
+    def signature(self, recipe_id):
+        if recipe_id in self.delta:
+            return self.delta[recipe_id]
+        position = np.searchsorted(self.recipe_ids, recipe_id)
+        if (
+            position < len(self.recipe_ids)
+            and self.recipe_ids[position] == recipe_id
+            and self.alive[position]
+        ):
+            return self.signature_matrix[position]
+        return None
+
+    def similar(self, recipe_id, limit):
+        """Похожие рецепты: список (id, оценка сходства) по убыванию."""
+        self.refresh()
+        with self.lock:
+            signature = self.signature(recipe_id)
+            if signature is None:
+                return []
+            keys = self.band_keys(signature[None, :])[0]
+            positions = []
+            for band, key in enumerate(keys):
+                start = np.searchsorted(self.band_sorted[band], key, 'left')
+                stop = np.searchsorted(self.band_sorted[band], key, 'right')
+                positions.append(self.band_positions[band][
+                    start:min(stop, start + LSH_BUCKET_LIMIT)
+                ])
+            positions = np.unique(np.concatenate(positions))
+            positions = positions[self.alive[positions]]
+            recipe_ids = self.recipe_ids[positions]
+            similarity = (
+                self.signature_matrix[positions] == signature
+            ).mean(axis=1)
+            if self.delta:
+                delta_ids = np.fromiter(self.delta, dtype=np.int64)
+                delta_signatures = np.stack(list(self.delta.values()))
+                collided = (self.band_keys(delta_signatures) == keys).any(
+                    axis=1
+                )
+                recipe_ids = np.concatenate(
+                    (recipe_ids, delta_ids[collided])
+                )
+                similarity = np.concatenate((similarity, (
+                    delta_signatures[collided] == signature
+                ).mean(axis=1)))
+        selected = recipe_ids != recipe_id
+        recipe_ids, similarity = recipe_ids[selected], similarity[selected]
+        order = np.lexsort((-recipe_ids, -similarity))[:limit]
+        return [
+            (int(recipe_ids[position]), round(float(similarity[position]), 4))
+            for position in order
+        ]
+
+    def rebuild(self, seq):
+        """Сначала снимок с диска, если лента изменений его догоняет."""
+        snapshot = self.load()
+        if snapshot is not None:
+            recipe_ids, signatures, snapshot_seq = snapshot
+            read, changed = get_recipe_changes(snapshot_seq, seq)
+            if changed is not None and read == seq:
+                self.set_arrays(recipe_ids, signatures)
+                if changed:
+                    self.apply(changed)
+                self.seq = seq
+                self.stalled_since = None
+                return
+        super().rebuild(seq)
+
+    @staticmethod
+    def load():
+        try:
+            with np.load(settings.SIMILARITY_INDEX_PATH) as snapshot:
+                return (
+                    snapshot['recipe_ids'],
+                    snapshot['signatures'],
+                    int(snapshot['seq']),
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def save(self, seq):
+        """Снимок сигнатур для быстрого старта процессов."""
+        path = Path(settings.SIMILARITY_INDEX_PATH)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(path.stem + '.tmp.npz')
+        np.savez(
+            temporary,
+            recipe_ids=self.recipe_ids,
+            signatures=self.signature_matrix,
+            seq=seq,
+        )
+        temporary.replace(path)
+
+
+ingredient_index = IngredientIndex()
+similarity_index = SimilarityIndex()
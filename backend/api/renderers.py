@@ -0,0 +1,12 @@
+from rest_framework.renderers import JSONRenderer
+
+from api.constans import NORMALIZED_FORMAT
+
+
+class NormalizedJSONRenderer(JSONRenderer):
+    """
+    JSON для ?format=normalized. Рендерер только выбирает режим:
+    ответ со ссылками по id собирают сериализатор и представление.
+    """
+
+    format = NORMALIZED_FORMAT
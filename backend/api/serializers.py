@@ -1,9 +1,38 @@
+import datetime
+
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from django.db import models
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
-from api.constans import MIN_VALUE
+from api.cache import (
+    get_recipe_fragments,
+    invalidate_recipe_fragments,
+    record_recipe_changes,
+    set_recipe_fragments,
+)
+from api.constans import (
+    BATCH_MAX_REQUESTS,
+    BATCH_PATH_PREFIX,
+    BATCH_STREAMING_VIEWS,
+    FACETS,
+    FACETS_PARAM,
+    FIELDS_PARAM,
+    INGREDIENT_SEARCH_MAX,
+    MIN_VALUE,
+    OMIT_PARAM,
+    RECIPE_SYNC_TOKEN,
+    SIMILAR_RECIPES_MAX,
+)
+from foodgram.constants import MAX_PAGE_SIZE, PAGE_SIZE
+from jobs.models import Job
 from recipes.models import (
     Cart,
     Favorite,
@@ -15,8 +44,62 @@ from recipes.models import (
 )
 from users.models import User
 
+SYNC_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def split_fields(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def requested_fields(request, serializer_class):
+    """
+    Поля ответа по параметрам ?fields= и ?omit=, None — все поля.
+    Неизвестные поля — ошибка 400.
+    """
+    fields = split_fields(request.query_params.get(FIELDS_PARAM))
+    omit = split_fields(request.query_params.get(OMIT_PARAM))
+    if not (fields or omit):
+        return None
+    available = serializer_class.Meta.fields
+    unknown = (fields | omit).difference(available)
+    if unknown:
+        raise serializers.ValidationError({
+            FIELDS_PARAM: 'Неизвестные поля: {}.'.format(
+                ', '.join(sorted(unknown))
+            )
+        })
+    return (fields or set(available)) - omit
+
+
+def requested_facets(request):
+    """Фасеты из параметра ?facets=, неизвестные — ошибка 400."""
+    facets = split_fields(request.query_params.get(FACETS_PARAM))
+    unknown = facets.difference(FACETS)
+    if unknown:
+        raise serializers.ValidationError({
+            FACETS_PARAM: 'Неизвестные фасеты: {}.'.format(
+                ', '.join(sorted(unknown))
+            )
+        })
+    return facets
 
-class UserSerializer(UserSerializer):
+
+class SparseFieldsMixin:
+    """
+    Оставляет только поля из context['fields'], если они заданы.
+    Действует на сериализатор, созданный с этим контекстом, вложенные
+    сериализаторы полей не меняются.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self._context.get('fields')
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserSerializer(SparseFieldsMixin, UserSerializer):
     """Получение информации о пользователе."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -164,7 +247,47 @@ class RecipeShortSerializer(serializers.ModelSerializer):
         read_only_fields = ('name', 'image', 'cooking_time')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class AuthorSerializer(serializers.ModelSerializer):
+    """Общая для всех пользователей часть данных автора."""
+
+    class Meta:
+        model = User
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeFragmentSerializer(SparseFieldsMixin,
+                               serializers.ModelSerializer):
+    """Общая для всех пользователей часть рецепта, хранится в кеше."""
+
+    prefetch = {
+        'author': 'author',
+        'tags': 'tags',
+        'ingredients': 'recipe_ingredients__ingredient',
+    }
+
+    author = AuthorSerializer()
+    tags = TagSerializer(many=True)
+    image = serializers.ReadOnlyField(source='image.url')
+    ingredients = RecipeIngredientSerializer(
+        many=True,
+        source='recipe_ingredients',
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'tags', 'author', 'ingredients',
+                  'name', 'image', 'text', 'cooking_time')
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов собирается из кеша одним проходом."""
+
+    def to_representation(self, data):
+        recipes = data.all() if isinstance(data, models.Manager) else data
+        return self.child.represent_many(list(recipes))
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Отображение рецептов."""
 
     author = UserSerializer()
@@ -174,37 +297,147 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredients',
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True)
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
                   'name', 'image', 'text', 'cooking_time')
+        list_serializer_class = RecipeListSerializer
 
-    def get_is_favorited(self, obj):
-        """Истина, если рецепт в избранном иначе Ложь."""
-        request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and obj.favorites.filter(
-                user=request.user
-            ).exists()
-        )
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, recipes):
+        """
+        Общие части берутся из кеша, поверх них — отметки пользователя.
+        При ?fields= недостающие части собираются только из нужных полей
+        и в кеш не попадают, как и при store_fragments=False в контексте.
+        """
+        fields = set(self.fields)
+        fragment_fields = RecipeFragmentSerializer.Meta.fields
+        partial = not fields.issuperset(fragment_fields)
+        fragments = get_recipe_fragments(recipe.pk for recipe in recipes)
+        missing = [recipe for recipe in recipes if recipe.pk not in fragments]
+        if missing:
+            if partial:
+                fragment_fields = fields.intersection(fragment_fields)
+            lookups = [
+                lookup
+                for field, lookup in RecipeFragmentSerializer.prefetch.items()
+                if field in fragment_fields
+            ]
+            if lookups:
+                models.prefetch_related_objects(missing, *lookups)
+            serializer = RecipeFragmentSerializer(
+                missing,
+                many=True,
+                context={'fields': fragment_fields if partial else None},
+            )
+            built = {
+                recipe.pk: fragment
+                for recipe, fragment in zip(missing, serializer.data)
+            }
+            if not partial and self.context.get('store_fragments', True):
+                set_recipe_fragments(built)
+            fragments.update(built)
+        favorited, in_cart, subscribed = self.get_user_marks(recipes, fields)
+        entities = self.context.get('entities')
+        return [
+            self.overlay(
+                fragments[recipe.pk],
+                is_favorited=recipe.pk in favorited,
+                is_in_shopping_cart=recipe.pk in in_cart,
+                is_subscribed=subscribed is None
+                or recipe.author_id in subscribed,
+                entities=entities,
+            )
+            for recipe in recipes
+        ]
 
-    def get_is_in_shopping_cart(self, obj):
-        """Истина, если рецепт в корзине, иначе Ложь."""
+    def get_user_marks(self, recipes, fields):
+        """
+        Id рецептов в избранном, в корзине и id авторов в подписках.
+        Для анонима вместо подписок возвращается None. Запросы выполняются
+        только для полей из fields.
+        """
         request = self.context.get('request')
-        return (
-            request
-            and request.user.is_authenticated
-            and obj.carts.filter(
-                user=request.user,
-                recipe=obj
-            ).exists()
+        if not (request and request.user.is_authenticated):
+            return set(), set(), None
+        user = request.user
+        recipe_ids = [recipe.pk for recipe in recipes]
+        favorited, in_cart, subscribed = set(), set(), set()
+        if 'is_favorited' in fields:
+            favorited = set(user.favorites.filter(
+                recipe__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+        if 'is_in_shopping_cart' in fields:
+            in_cart = set(user.carts.filter(
+                recipe__in=recipe_ids
+            ).values_list('recipe_id', flat=True))
+        if 'author' in fields:
+            subscribed = set(user.follower.filter(
+                author__in={recipe.author_id for recipe in recipes}
+            ).values_list('author_id', flat=True))
+        return favorited, in_cart, subscribed
+
+    def overlay(self, fragment, is_favorited, is_in_shopping_cart,
+                is_subscribed, entities=None):
+        """
+        Собрать ответ из фрагмента и отметок текущего пользователя.
+        Если в контексте есть entities, вложенные объекты заменяются id.
+        """
+        request = self.context.get('request')
+        data = OrderedDict(
+            (field, fragment.get(field)) for field in self.fields
         )
+        if entities is not None:
+            self.extract_entities(data, entities, is_subscribed)
+        elif 'author' in data:
+            data['author'] = OrderedDict(
+                fragment['author'], is_subscribed=is_subscribed
+            )
+        if 'is_favorited' in data:
+            data['is_favorited'] = is_favorited
+        if 'is_in_shopping_cart' in data:
+            data['is_in_shopping_cart'] = is_in_shopping_cart
+        if request and data.get('image'):
+            data['image'] = request.build_absolute_uri(data['image'])
+        return data
+
+    @staticmethod
+    def extract_entities(data, entities, is_subscribed):
+        """
+        Автор, теги и ингредиенты рецепта переносятся в словари entities
+        по id, каждый объект — один раз на ответ. В рецепте остаются id,
+        у ингредиентов — id и количество.
+        """
+        if 'author' in data:
+            author = data['author']
+            if author['id'] not in entities['authors']:
+                entities['authors'][author['id']] = OrderedDict(
+                    author, is_subscribed=is_subscribed
+                )
+            data['author'] = author['id']
+        if 'tags' in data:
+            for tag in data['tags']:
+                entities['tags'].setdefault(tag['id'], tag)
+            data['tags'] = [tag['id'] for tag in data['tags']]
+        if 'ingredients' in data:
+            ingredients = entities['ingredients']
+            for item in data['ingredients']:
+                if item['id'] not in ingredients:
+                    ingredients[item['id']] = {
+                        'id': item['id'],
+                        'name': item['name'],
+                        'measurement_unit': item['measurement_unit'],
+                    }
+            data['ingredients'] = [
+                {'id': item['id'], 'amount': item['amount']}
+                for item in data['ingredients']
+            ]
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -239,6 +472,9 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             )
             for ingredient_data in ingredients
         ])
+        # bulk_create не отправляет сигналы, кеш сбрасывается вручную.
+        invalidate_recipe_fragments([instance.pk])
+        record_recipe_changes([instance.pk])
 
     def create(self, validated_data):
         """Создание рецепта."""
@@ -296,6 +532,95 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         return value
 
 
+class IngredientSearchSerializer(serializers.Serializer):
+    """Параметры поиска рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=MIN_VALUE),
+        min_length=1,
+        max_length=INGREDIENT_SEARCH_MAX,
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+
+class SimilarRecipesSerializer(serializers.Serializer):
+    """Параметры списка похожих рецептов."""
+
+    limit = serializers.IntegerField(
+        min_value=MIN_VALUE, max_value=SIMILAR_RECIPES_MAX, default=PAGE_SIZE
+    )
+
+
+def sync_token(moment, pk):
+    """Позиция в ленте изменений: время в микросекундах и id рецепта."""
+    return RECIPE_SYNC_TOKEN.format(
+        moment=(moment - SYNC_EPOCH) // datetime.timedelta(microseconds=1),
+        id=pk,
+    )
+
+
+class RecipeChangesSerializer(serializers.Serializer):
+    """Параметры ленты изменений рецептов."""
+
+    since = serializers.RegexField(r'^\d+-\d+$', required=False)
+    limit = serializers.IntegerField(
+        min_value=MIN_VALUE, max_value=MAX_PAGE_SIZE, default=MAX_PAGE_SIZE
+    )
+
+    def validate_since(self, value):
+        """Токен превращается в пару (время, id)."""
+        moment, pk = value.split('-')
+        try:
+            moment = SYNC_EPOCH + datetime.timedelta(
+                microseconds=int(moment)
+            )
+        except OverflowError:
+            raise serializers.ValidationError('Неверный токен.')
+        return moment, int(pk)
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """Подзапрос пакета: только GET к API."""
+
+    method = serializers.ChoiceField(choices=('GET',), default='GET')
+    path = serializers.CharField()
+
+    def validate_path(self, value):
+        if not value.startswith(BATCH_PATH_PREFIX):
+            raise serializers.ValidationError(
+                f'Путь должен начинаться с {BATCH_PATH_PREFIX}'
+            )
+        try:
+            match = resolve(urlsplit(value).path)
+        except Resolver404:
+            return value
+        if match.view_name in BATCH_STREAMING_VIEWS:
+            raise serializers.ValidationError(
+                'Потоковый ответ нельзя вернуть в пакете.'
+            )
+        return value
+
+
+class BatchSerializer(serializers.Serializer):
+    """Пакет подзапросов."""
+
+    requests = serializers.ListField(
+        child=BatchRequestSerializer(),
+        min_length=1,
+        max_length=BATCH_MAX_REQUESTS,
+    )
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Статус фоновой задачи."""
+
+    class Meta:
+        model = Job
+        fields = ('id', 'name', 'status', 'attempts', 'max_attempts',
+                  'run_at', 'created', 'finished', 'result', 'error')
+        read_only_fields = fields
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Сериализатор подписок."""
 
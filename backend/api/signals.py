@@ -0,0 +1,127 @@
+from django.db.backends.signals import connection_created
+from django.db.models import signals
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens
+from api.cache import (
+    bump_catalog_version,
+    bump_recipe_facets_version,
+    invalidate_recipe_fragments,
+    record_recipe_changes,
+)
+from api.limits import release_stale_deadline
+from foodgram.executors import install_wrapper, run_request_wrappers
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.signals import touch_recipes
+from users.models import User
+
+AUTHOR_PUBLIC_FIELDS = frozenset(
+    ('email', 'username', 'first_name', 'last_name')
+)
+LOGIN_ONLY_FIELDS = frozenset(('last_login',))
+
+
+@receiver(signals.post_save, sender=Recipe)
+@receiver(signals.post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.pk])
+
+
+@receiver(signals.post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    record_recipe_changes([instance.pk])
+    bump_recipe_facets_version()
+
+
+@receiver(signals.post_save, sender=RecipeIngredient)
+@receiver(signals.post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    invalidate_recipe_fragments([instance.recipe_id])
+    record_recipe_changes([instance.recipe_id])
+
+
+@receiver(signals.m2m_changed, sender=Recipe.tags.through)
+@receiver(signals.m2m_changed, sender=Recipe.ingredients.through)
+def recipe_relations_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if not action.startswith('post_'):
+        return
+    if sender is Recipe.tags.through:
+        bump_recipe_facets_version()
+    if not reverse:
+        invalidate_recipe_fragments([instance.pk])
+    else:
+        bump_catalog_version()
+        touch_recipes(Recipe.objects.filter(pk__in=pk_set or ()))
+    if sender is Recipe.ingredients.through:
+        record_recipe_changes(pk_set if reverse else [instance.pk])
+
+
+@receiver(signals.post_save, sender=Tag)
+@receiver(signals.post_delete, sender=Tag)
+@receiver(signals.post_save, sender=Ingredient)
+@receiver(signals.post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_version()
+
+
+def public_profile(user):
+    return {field: getattr(user, field) for field in AUTHOR_PUBLIC_FIELDS}
+
+
+@receiver(signals.pre_save, sender=User)
+def remember_public_profile(sender, instance, update_fields, **kwargs):
+    instance.previous_profile = None
+    if instance.pk and (
+        update_fields is None
+        or not AUTHOR_PUBLIC_FIELDS.isdisjoint(update_fields)
+    ):
+        instance.previous_profile = User.objects.filter(
+            pk=instance.pk
+        ).values(*AUTHOR_PUBLIC_FIELDS).first()
+
+
+@receiver(signals.post_save, sender=User)
+def author_changed(sender, instance, created, update_fields, **kwargs):
+    """
+    Автор виден в каждом своём рецепте, но сбрасывать их стоит только
+    при смене публичных полей: save() без update_fields (например, смена
+    пароля) их обычно не трогает.
+    """
+    if created or (
+        update_fields and AUTHOR_PUBLIC_FIELDS.isdisjoint(update_fields)
+    ):
+        return
+    previous = getattr(instance, 'previous_profile', None)
+    if previous is not None and previous == public_profile(instance):
+        return
+    invalidate_recipe_fragments(
+        instance.recipes.values_list('pk', flat=True)
+    )
+    touch_recipes(instance.recipes.all())
+
+
+@receiver(signals.post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens([instance.key])
+
+
+@receiver(signals.post_save, sender=User)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    """Пароль, is_active и профиль в кеше токенов должны быть свежими."""
+    if created or (update_fields and LOGIN_ONLY_FIELDS.issuperset(
+        update_fields
+    )):
+        return
+    invalidate_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    connection.statement_deadline = None
+    install_wrapper(connection, run_request_wrappers)
+    install_wrapper(connection, release_stale_deadline)
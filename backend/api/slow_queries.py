@@ -0,0 +1,102 @@
+"""
+Журнал медленных SQL-запросов с планами выполнения.
+
+Запросы дольше SLOW_QUERY_THRESHOLD_MS пишутся строками JSON в файл
+SLOW_QUERY_LOG. План (EXPLAIN) снимается один раз на процесс
+для каждого отпечатка запроса: запросы, отличающиеся только
+значениями параметров, считаются одинаковыми.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*\?\s*,)*\s*\?\s*\)')
+WHITESPACE = re.compile(r'\s+')
+ANALYZABLE = ('SELECT', 'WITH')
+
+write_lock = threading.Lock()
+explained = set()
+
+
+def normalize(sql):
+    """SQL без значений: литералы и параметры заменены на ?."""
+    sql = STRING_LITERAL.sub('?', sql.replace('%s', '?'))
+    sql = NUMBER_LITERAL.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def explain(connection, sql, params):
+    """План запроса в виде строк или None, если его не удалось снять."""
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif (
+        settings.SLOW_QUERY_EXPLAIN_ANALYZE
+        and sql.lstrip().upper().startswith(ANALYZABLE)
+    ):
+        prefix = 'EXPLAIN ANALYZE '
+    else:
+        prefix = 'EXPLAIN '
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(prefix + sql, params)
+                return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError:
+        return None
+
+
+class SlowQueryLogger:
+    """
+    Обёртка execute_wrapper, записывающая медленные запросы. Одна на
+    HTTP-запрос: запросы к базе могут идти из нескольких потоков.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.state = threading.local()
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(self.state, 'explaining', False):
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = (time.perf_counter() - started) * 1000
+        if duration >= settings.SLOW_QUERY_THRESHOLD_MS:
+            self.log(context['connection'], sql, params, many, duration)
+        return result
+
+    def log(self, connection, sql, params, many, duration):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        entry = {
+            'time': time.time(),
+            'fingerprint': key,
+            'sql': normalized,
+            'ms': round(duration, 2),
+            'database': connection.alias,
+            **self.source(),
+        }
+        if key not in explained and not many:
+            explained.add(key)
+            self.state.explaining = True
+            try:
+                entry['plan'] = explain(connection, sql, params)
+            finally:
+                self.state.explaining = False
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with write_lock, open(
+            settings.SLOW_QUERY_LOG, 'a', encoding='utf8'
+        ) as file:
+            file.write(line)
@@ -0,0 +1,333 @@
+"""
+Снимок каталога: таблицы приложений users и recipes в zip-архиве,
+по одному CSV на таблицу и manifest.json с порядком и колонками.
+
+Таблицы пишутся и читаются потоком в порядке зависимостей по внешним
+ключам. В пустую базу PostgreSQL данные загружаются через COPY с
+исходными id, в остальных случаях — пачками bulk_create. При загрузке
+в непустую базу (append) id сдвигаются на максимальный id таблицы, а
+пользователи, теги и ингредиенты с тем же естественным ключом
+(email, slug, название и единица) совпадают с уже существующими.
+"""
+import csv
+import io
+import json
+import zipfile
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api.cache import bump_catalog_version, record_recipe_changes
+from api.constans import (
+    SNAPSHOT_APPS,
+    SNAPSHOT_BATCH_SIZE,
+    SNAPSHOT_CHUNK_SIZE,
+    SNAPSHOT_EXCLUDE,
+    SNAPSHOT_MANIFEST,
+    SNAPSHOT_NATURAL_KEYS,
+    SNAPSHOT_NULL,
+    SNAPSHOT_VERSION,
+)
+from recipes.models import Recipe
+from recipes.signals import touch_recipes
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_models():
+    """Модели снимка в порядке зависимостей по внешним ключам."""
+    models = [
+        model
+        for app_label in SNAPSHOT_APPS
+        for model in apps.get_app_config(app_label).get_models(
+            include_auto_created=True
+        )
+        if model._meta.label_lower not in SNAPSHOT_EXCLUDE
+    ]
+    included = set(models)
+    models = [
+        model for model in models
+        if all(
+            related in included for related in dependencies(model)
+        )
+    ]
+    ordered = []
+    while models:
+        ready = [
+            model for model in models
+            if set(dependencies(model)) <= set(ordered) | {model}
+        ]
+        if not ready:
+            raise SnapshotError('Циклические внешние ключи между таблицами.')
+        ordered.extend(ready)
+        models = [model for model in models if model not in ready]
+    return ordered
+
+
+def dependencies(model):
+    return [
+        field.related_model
+        for field in model._meta.concrete_fields
+        if field.is_relation
+    ]
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def table_file(model):
+    return f'{model._meta.label_lower}.csv'
+
+
+def export_snapshot(path, chunk_size=SNAPSHOT_CHUNK_SIZE, report=None):
+    """
+    Записать снимок в path, report(модель, строк) вызывается после
+    каждой таблицы. На PostgreSQL все таблицы читаются в одной транзакции
+    REPEATABLE READ: снимок согласован без блокировки записи.
+    """
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'created': timezone.now().isoformat(),
+        'tables': [],
+    }
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SET TRANSACTION ISOLATION LEVEL REPEATABLE READ'
+                    )
+            for model in snapshot_models():
+                names = columns(model)
+                rows = model._base_manager.order_by('pk').values_list(
+                    *names
+                ).iterator(chunk_size=chunk_size)
+                with archive.open(
+                    table_file(model), 'w', force_zip64=True
+                ) as raw:
+                    count = write_csv(raw, names, rows)
+                manifest['tables'].append({
+                    'model': model._meta.label_lower,
+                    'file': table_file(model),
+                    'columns': names,
+                    'rows': count,
+                })
+                if report:
+                    report(model._meta.label_lower, count)
+        archive.writestr(
+            SNAPSHOT_MANIFEST, json.dumps(manifest, ensure_ascii=False)
+        )
+
+
+def write_csv(raw, names, rows):
+    text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    writer = csv.writer(text)
+    writer.writerow(names)
+    count = 0
+    for row in rows:
+        writer.writerow(
+            [SNAPSHOT_NULL if value is None else value for value in row]
+        )
+        count += 1
+    text.flush()
+    text.detach()
+    return count
+
+
+class IdRemap:
+    """
+    Новые id таблицы: сдвиг на максимальный существующий id, для строк,
+    совпавших по естественному ключу, — id существующей строки.
+    """
+
+    def __init__(self, model, append):
+        self.offset = 0
+        if append:
+            self.offset = model._base_manager.aggregate(
+                top=Max('pk')
+            )['top'] or 0
+        self.matched = {}
+
+    def __call__(self, old_id):
+        return self.matched.get(old_id, old_id + self.offset)
+
+
+def import_snapshot(path, append=False, batch_size=SNAPSHOT_BATCH_SIZE,
+                    report=None):
+    """
+    Загрузить снимок из path в одной транзакции. Без append все таблицы
+    снимка в базе должны быть пустыми.
+    """
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(SNAPSHOT_MANIFEST))
+        if manifest.get('version') != SNAPSHOT_VERSION:
+            raise SnapshotError(
+                f'Неподдерживаемая версия снимка: {manifest.get("version")}.'
+            )
+        tables = [
+            (apps.get_model(table['model']), table)
+            for table in manifest['tables']
+        ]
+        with transaction.atomic():
+            if not append:
+                filled = [
+                    model._meta.label for model, _ in tables
+                    if model._base_manager.exists()
+                ]
+                if filled:
+                    raise SnapshotError(
+                        'Таблицы не пустые: {}. Используйте --append.'
+                        .format(', '.join(filled))
+                    )
+            remaps = {}
+            for model, table in tables:
+                remaps[model] = IdRemap(model, append)
+                with archive.open(table['file']) as raw:
+                    if not append and connection.vendor == 'postgresql':
+                        count = copy_table(model, table['columns'], raw)
+                    else:
+                        count = insert_table(
+                            model, raw, remaps, append, batch_size
+                        )
+                if report:
+                    report(model._meta.label_lower, count)
+            reset_sequences([model for model, _ in tables])
+            if append and Recipe in remaps:
+                touch_recipes(
+                    Recipe.objects.filter(pk__gt=remaps[Recipe].offset)
+                )
+            bump_catalog_version()
+            record_recipe_changes(None)
+
+
+def copy_table(model, names, raw):
+    """COPY из CSV архива без разбора строк в Python."""
+    quote = connection.ops.quote_name
+    column = {
+        field.attname: field.column for field in model._meta.concrete_fields
+    }
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            "COPY {} ({}) FROM STDIN WITH (FORMAT csv, HEADER true, "
+            "NULL '{}')".format(
+                quote(model._meta.db_table),
+                ', '.join(quote(column[name]) for name in names),
+                SNAPSHOT_NULL,
+            ),
+            raw,
+        )
+        return cursor.rowcount
+
+
+def insert_table(model, raw, remaps, append, batch_size):
+    reader = csv.reader(io.TextIOWrapper(raw, encoding='utf-8', newline=''))
+    names = next(reader)
+    fields = [
+        next(field for field in model._meta.concrete_fields
+             if field.attname == name)
+        for name in names
+    ]
+    count = 0
+    batch = []
+    for row in reader:
+        batch.append(row)
+        if len(batch) == batch_size:
+            count += insert_batch(model, fields, batch, remaps, append)
+            batch = []
+    if batch:
+        count += insert_batch(model, fields, batch, remaps, append)
+    return count
+
+
+def insert_batch(model, fields, rows, remaps, append):
+    """
+    Значения из CSV приводятся полями модели и вставляются одним
+    executemany, без создания экземпляров моделей. Возвращает число
+    действительно вставленных строк: в режиме append уже существующие
+    строки пропускаются.
+    """
+    remap = remaps[model]
+    prepared = []
+    for row in rows:
+        values = []
+        for field, value in zip(fields, row):
+            if value == SNAPSHOT_NULL:
+                value = None
+            else:
+                value = field.to_python(value)
+                if field.primary_key:
+                    value = remap(value)
+                elif field.is_relation:
+                    value = remaps[field.related_model](value)
+            values.append(value)
+        prepared.append(values)
+    natural_key = SNAPSHOT_NATURAL_KEYS.get(model._meta.label_lower)
+    if append and natural_key:
+        prepared = match_existing(model, fields, prepared, natural_key, remap)
+    return insert_rows(model, fields, prepared, append and not natural_key)
+
+
+def insert_rows(model, fields, rows, ignore_conflicts):
+    """
+    Число вставленных строк берётся из rowcount: при ignore_conflicts
+    строки с конфликтом ключа в него не входят.
+    """
+    if not rows:
+        return 0
+    operations = connection.ops
+    sql = '{} {} ({}) VALUES ({}) {}'.format(
+        operations.insert_statement(ignore_conflicts=ignore_conflicts),
+        operations.quote_name(model._meta.db_table),
+        ', '.join(operations.quote_name(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+        operations.ignore_conflicts_suffix_sql(
+            ignore_conflicts=ignore_conflicts
+        ),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [
+                field.get_db_prep_save(value, connection)
+                for field, value in zip(fields, row)
+            ]
+            for row in rows
+        ])
+        return cursor.rowcount
+
+
+def match_existing(model, fields, rows, natural_key, remap):
+    """
+    Строки, которые уже есть в базе по естественному ключу, не
+    вставляются: их id заменяются на id существующих строк.
+    """
+    names = [field.attname for field in fields]
+    positions = [names.index(name) for name in natural_key]
+    pk = names.index(model._meta.pk.attname)
+    existing = {
+        values[:-1]: values[-1]
+        for values in model._base_manager.filter(**{
+            f'{natural_key[0]}__in': {row[positions[0]] for row in rows}
+        }).values_list(*natural_key, 'pk')
+    }
+    new = []
+    for row in rows:
+        key = tuple(row[position] for position in positions)
+        if key in existing:
+            remap.matched[row[pk] - remap.offset] = existing[key]
+        else:
+            new.append(row)
+    return new
+
+
+def reset_sequences(models):
+    """Счётчики id после вставки с явными id (PostgreSQL)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
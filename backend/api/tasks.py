@@ -0,0 +1,38 @@
+from api import deletion
+from api.cache import get_recipe_changes_seq
+from api.recipe_index import SimilarityIndex
+from jobs.registry import report_progress, task
+from recipes.models import Recipe
+from users.models import User
+
+
+def deletion_progress(done, total):
+    report_progress(deleted=done, total=total)
+
+
+@task()
+def build_similarity_index():
+    """Снимок индекса похожих рецептов, как build_similarity_index."""
+    seq = get_recipe_changes_seq()
+    index = SimilarityIndex()
+    index.build()
+    index.save(seq)
+    return {'recipes': len(index.recipe_ids), 'seq': seq}
+
+
+@task()
+def delete_recipes(recipe_ids):
+    """Удаление большого числа рецептов, прогресс — в result задачи."""
+    deleted = deletion.delete_recipes(
+        Recipe.objects.filter(pk__in=recipe_ids), progress=deletion_progress
+    )
+    return {'deleted': dict(+deleted)}
+
+
+@task()
+def delete_users(user_ids):
+    """Удаление пользователей вместе с рецептами, прогресс — в result."""
+    deleted = deletion.delete_users(
+        User.objects.filter(pk__in=user_ids), progress=deletion_progress
+    )
+    return {'deleted': dict(+deleted)}
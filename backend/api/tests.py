@@ -0,0 +1,275 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import numpy as np
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import deletion
+from api.cache import (
+    get_recipe_fragments,
+    invalidate_recipe_fragments,
+    set_recipe_fragments,
+)
+from api.recipe_index import Ranking
+from api.serializers import sync_token
+from recipes.models import (
+    Cart,
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Tag,
+)
+from users.models import User
+
+TEST_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'foodgram-tests-{alias}',
+    }
+    for alias in ('default', 'versions')
+}
+
+
+def create_user(number):
+    return User.objects.create_user(
+        email=f'user{number}@example.com',
+        username=f'user{number}',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='password-123',
+    )
+
+
+@override_settings(CACHES=TEST_CACHES, RECIPE_SYNC_LAG=0)
+class RecipeTestCase(TestCase):
+    """Авторы, теги, ингредиенты и рецепты, созданные без API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user(1)
+        cls.reader = create_user(2)
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        token = Token.objects.create(user=self.reader)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def create_recipe(self, name, author=None):
+        recipe = Recipe.objects.create(
+            author=author or self.author,
+            name=name,
+            text='Описание',
+            cooking_time=10,
+            image='recipes/test.png',
+        )
+        recipe.tags.add(self.tag)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=5)
+            for ingredient in self.ingredients
+        )
+        return recipe
+
+
+class RecipeFragmentTests(RecipeTestCase):
+    """Кеш общих частей рецептов."""
+
+    def test_list_stores_fragments(self):
+        recipe = self.create_recipe('Каша')
+        self.client.get('/api/recipes/')
+        self.assertIn(recipe.pk, get_recipe_fragments([recipe.pk]))
+
+    def test_save_invalidates_fragment(self):
+        recipe = self.create_recipe('Каша')
+        self.client.get('/api/recipes/')
+        recipe.name = 'Омлет'
+        recipe.save()
+        self.assertEqual(get_recipe_fragments([recipe.pk]), {})
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.json()['name'], 'Омлет')
+
+    def test_tag_change_invalidates_fragment(self):
+        recipe = self.create_recipe('Каша')
+        self.client.get('/api/recipes/')
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        self.assertEqual(get_recipe_fragments([recipe.pk]), {})
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.json()['tags'][0]['name'], 'Ужин')
+
+    def test_fragment_cached_in_transaction_is_deleted_on_commit(self):
+        recipe = self.create_recipe('Каша')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_recipe_fragments([recipe.pk])
+            set_recipe_fragments({recipe.pk: {'name': 'Каша'}})
+            self.assertIn(recipe.pk, get_recipe_fragments([recipe.pk]))
+        self.assertEqual(get_recipe_fragments([recipe.pk]), {})
+
+
+class RankingTests(TestCase):
+    """Частичная сортировка совпадает с полной."""
+
+    def ranking(self, size, seed):
+        random = np.random.default_rng(seed)
+        recipe_ids = random.permutation(size * 3)[:size] + 1
+        valid = random.random(size) < 0.8
+        coverage = np.where(valid, random.integers(1, 5, size) / 4, -1.0)
+        missing = random.integers(0, 4, size)
+        return Ranking(
+            recipe_ids, coverage, missing, int(np.count_nonzero(valid))
+        )
+
+    @staticmethod
+    def expected(ranking):
+        order = np.lexsort((
+            -ranking.recipe_ids, ranking.missing, -ranking.coverage
+        ))[:ranking.count]
+        return [
+            (
+                int(ranking.recipe_ids[position]),
+                round(float(ranking.coverage[position]), 4),
+                int(ranking.missing[position]),
+            )
+            for position in order
+        ]
+
+    def test_pages_match_full_sort(self):
+        for seed in range(20):
+            ranking = self.ranking(200, seed)
+            expected = self.expected(ranking)
+            for start, stop in (
+                (0, 1), (0, 10), (7, 23), (ranking.count - 5, ranking.count),
+                (ranking.count - 3, ranking.count + 10), (0, 1000),
+            ):
+                with self.subTest(seed=seed, start=start, stop=stop):
+                    self.assertEqual(
+                        ranking[start:stop], expected[start:stop]
+                    )
+
+    def test_empty(self):
+        ranking = Ranking(
+            np.arange(3), np.full(3, -1.0), np.zeros(3, dtype=int), 0
+        )
+        self.assertEqual(len(ranking), 0)
+        self.assertEqual(ranking[0:10], [])
+
+
+class DeletionTests(RecipeTestCase):
+    """Число удалённых строк по моделям совпадает с базой."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [self.create_recipe(f'Рецепт {n}') for n in range(3)]
+        other = self.create_recipe('Чужой', author=self.reader)
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        Favorite.objects.create(user=self.author, recipe=other)
+        Cart.objects.create(user=self.reader, recipe=self.recipes[1])
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        Token.objects.create(user=self.author)
+
+    @staticmethod
+    def counts(labels):
+        return {
+            label: apps.get_model(label).objects.count() for label in labels
+        }
+
+    def assert_deleted(self, delete):
+        labels = [
+            model._meta.label
+            for model in apps.get_models(include_auto_created=True)
+            if not model._meta.proxy
+        ]
+        before = self.counts(labels)
+        deleted = +delete()
+        after = self.counts(labels)
+        self.assertEqual(deleted, Counter({
+            label: before[label] - after[label]
+            for label in labels
+            if before[label] > after[label]
+        }))
+        return deleted
+
+    def test_delete_recipes(self):
+        recipes = Recipe.objects.filter(author=self.author)
+        expected = {
+            model._meta.label: count
+            for model, count in deletion.cascade_count(recipes).items()
+        }
+        deleted = self.assert_deleted(
+            lambda: deletion.delete_recipes(recipes)
+        )
+        self.assertEqual(deleted, expected)
+        self.assertEqual(deleted['recipes.Recipe'], 3)
+        self.assertEqual(deleted['recipes.RecipeIngredient'], 9)
+
+    def test_delete_users(self):
+        deleted = self.assert_deleted(lambda: deletion.delete_users(
+            User.objects.filter(pk=self.author.pk)
+        ))
+        self.assertEqual(deleted['users.User'], 1)
+        self.assertEqual(deleted['recipes.Recipe'], 3)
+        self.assertEqual(deleted['recipes.Follow'], 2)
+        self.assertEqual(deleted['authtoken.Token'], 1)
+        self.assertTrue(Recipe.objects.filter(author=self.reader).exists())
+
+
+class RecipeChangesTests(RecipeTestCase):
+    """Лента /api/recipes/changes/."""
+
+    url = '/api/recipes/changes/'
+
+    def test_paging(self):
+        recipes = [self.create_recipe(f'Рецепт {n}') for n in range(3)]
+        first = self.client.get(self.url, {'limit': 2}).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in first['changed']],
+            [recipe.pk for recipe in recipes[:2]],
+        )
+        self.assertTrue(first['has_more'])
+        second = self.client.get(
+            self.url, {'limit': 2, 'since': first['next']}
+        ).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in second['changed']], [recipes[2].pk]
+        )
+        self.assertFalse(second['has_more'])
+        deleted_id = recipes[0].pk
+        recipes[0].delete()
+        third = self.client.get(
+            self.url, {'limit': 2, 'since': second['next']}
+        ).json()
+        self.assertEqual(third['changed'], [])
+        self.assertEqual(third['deleted'], [deleted_id])
+        empty = self.client.get(
+            self.url, {'limit': 2, 'since': third['next']}
+        ).json()
+        self.assertEqual(empty['changed'], [])
+        self.assertEqual(empty['deleted'], [])
+        self.assertEqual(empty['next'], third['next'])
+
+    def test_expired_token(self):
+        moment = timezone.now() - timedelta(
+            days=settings.RECIPE_TOMBSTONE_DAYS + 1
+        )
+        response = self.client.get(
+            self.url, {'since': sync_token(moment, 1)}
+        )
+        self.assertEqual(response.status_code, 410)
@@ -1,18 +1,50 @@
+from django.conf import settings
 from django.urls import include, path
 
 from rest_framework import routers
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api import async_views
+from api.views import (
+    BatchView,
+    IngredientViewSet,
+    JobViewSet,
+    MetricsView,
+    RecipeViewSet,
+    TagViewSet,
+    UserViewSet,
+)
 
 router = routers.DefaultRouter()
 router.register('ingredients', IngredientViewSet, basename='ingredients')
+router.register('jobs', JobViewSet, basename='jobs')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('tags', TagViewSet, basename='tags')
 router.register('users', UserViewSet, basename='users')
 
 
 urlpatterns = [
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('batch/', BatchView.as_view(), name='batch'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
+
+if settings.ASYNC_API:
+    urlpatterns = [
+        path(
+            'recipes/download_shopping_cart/',
+            async_views.download_shopping_cart,
+            name='recipes-download_shopping_cart',
+        ),
+        path(
+            'ingredients/',
+            async_views.ingredient_list,
+            name='ingredients-list',
+        ),
+        path(
+            'users/subscriptions/',
+            async_views.subscriptions,
+            name='users-subscriptions',
+        ),
+    ] + urlpatterns
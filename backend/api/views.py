@@ -1,29 +1,75 @@
+import asyncio
 import csv
+import heapq
+import io
+import json
 
-from django.db.models import Sum
+from collections import OrderedDict
+from datetime import timedelta
+from itertools import islice
+from operator import itemgetter
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.wsgi import WSGIRequest
+from django.db.models import Count, Q, Sum
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import HttpResponse, get_object_or_404
+from django.urls import Resolver404, resolve
+from django.utils import timezone
 
+from asgiref.sync import async_to_sync
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import permissions, status
+from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from api import deletion, tasks
+from api.authentication import invalidate_tokens
+from api.cache import get_recipe_facets, get_reference_list
+from api.constans import (
+    DEFERRABLE_RECIPE_FIELDS,
+    DEFERRABLE_USER_FIELDS,
+    DELETE_SYNC_MAX,
+    EXPORT_CHUNK_SIZE,
+    FACET_USER_FILTERS,
+    NORMALIZED_ACTIONS,
+    NORMALIZED_FORMAT,
+)
+from api.deletion import delete_recipes, delete_users, fast_delete
 from api.filters import IngredientFilter, RecipeFilter
+from api.metrics import render_prometheus
 from api.pagination import PageLimitPagination
 from api.permissions import AuthorOrReadOnly
+from api.recipe_index import ingredient_index, similarity_index
+from api.renderers import NormalizedJSONRenderer
 from api.serializers import (
+    BatchSerializer,
     CartSerializer,
     FavoriteSerializer,
+    IngredientSearchSerializer,
     IngredientSerializer,
+    JobSerializer,
+    RecipeChangesSerializer,
     RecipeCreateSerializer,
     RecipeSerializer,
+    SimilarRecipesSerializer,
     SubscriptionSerializer,
     SubscriptionShowSerializer,
     TagSerializer,
     UserSerializer,
+    requested_facets,
+    requested_fields,
+    sync_token,
 )
+from jobs.models import Job
 from recipes.models import (
     Cart,
     Favorite,
@@ -31,12 +77,60 @@ from recipes.models import (
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeTombstone,
     Tag,
 )
 from users.models import User
 
 
-class UserViewSet(UserViewSet):
+def defer_fields(queryset, deferrable_fields, fields):
+    """Не читать столбцы полей, которых нет в fields."""
+    if fields is None:
+        return queryset
+    return queryset.defer(*(
+        field for field in deferrable_fields if field not in fields
+    ))
+
+
+def after_position(moment_field, id_field, position):
+    """Строки после позиции (время, id) в порядке moment_field, id_field."""
+    if position is None:
+        return Q()
+    moment, pk = position
+    return Q(**{f'{moment_field}__gt': moment}) | Q(
+        **{moment_field: moment, f'{id_field}__gt': pk}
+    )
+
+
+class SparseFieldsViewMixin:
+    """
+    Параметры ?fields= и ?omit= для GET-запросов: лишние поля убираются
+    из ответа, их столбцы не читаются из базы.
+    """
+
+    deferrable_fields = ()
+
+    def requested_fields(self, serializer_class=None):
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None
+        return requested_fields(
+            self.request, serializer_class or self.get_serializer_class()
+        )
+
+    def get_queryset(self):
+        return defer_fields(
+            super().get_queryset(),
+            self.deferrable_fields,
+            self.requested_fields(),
+        )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = self.requested_fields()
+        return context
+
+
+class UserViewSet(SparseFieldsViewMixin, UserViewSet):
     """Для работы с пользователями и подписками."""
 
     queryset = User.objects.all()
@@ -45,6 +139,7 @@ class UserViewSet(UserViewSet):
         AuthorOrReadOnly,
         permissions.IsAuthenticatedOrReadOnly,
     )
+    deferrable_fields = DEFERRABLE_USER_FIELDS
 
     @action(
         detail=True,
@@ -86,13 +181,25 @@ class UserViewSet(UserViewSet):
     )
     def get_subscriptions(self, request):
         """Список авторов на которых подписан."""
-        authors = User.objects.filter(following__user=request.user)
+        return self.subscriptions_response(request)
+
+    @staticmethod
+    def subscriptions_response(request):
+        """Страница подписок, общая для синхронного и ASGI-режима."""
+        fields = requested_fields(request, SubscriptionShowSerializer)
+        authors = defer_fields(
+            User.objects.filter(following__user=request.user),
+            DEFERRABLE_USER_FIELDS,
+            fields,
+        )
         paginator = PageLimitPagination()
         result_pages = paginator.paginate_queryset(
             queryset=authors, request=request
         )
         serializer = SubscriptionShowSerializer(
-            result_pages, context={'request': request}, many=True
+            result_pages,
+            context={'request': request, 'fields': fields},
+            many=True,
         )
         return paginator.get_paginated_response(serializer.data)
 
@@ -114,10 +221,35 @@ class UserViewSet(UserViewSet):
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
         serializer = UserSerializer(
-            request.user, context={'request': request}
+            request.user, context=self.get_serializer_context()
         )
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def destroy(self, request, *args, **kwargs):
+        """
+        Пользователь с небольшим числом рецептов удаляется сразу. Иначе
+        он выключается и теряет токены, а данные удаляет фоновая задача:
+        ответ 202 со статусом задачи.
+        """
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        users = User.objects.filter(pk=instance.pk)
+        if instance.recipes.count() < DELETE_SYNC_MAX:
+            delete_users(users)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        users.update(is_active=False)
+        tokens = Token.objects.filter(user=instance)
+        invalidate_tokens(list(tokens.values_list('key', flat=True)))
+        fast_delete(tokens)
+        job = tasks.delete_users.enqueue(
+            args=[[instance.pk]],
+            user=None if instance == request.user else request.user,
+        )
+        return Response(
+            JobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+        )
+
 
 class IngredientViewSet(ReadOnlyModelViewSet):
     """Для работы с ингредиентами."""
@@ -130,6 +262,18 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend, )
     search_fields = ('^name', )
 
+    @staticmethod
+    def reference_list():
+        """Все ингредиенты из кеша справочников."""
+        return get_reference_list('ingredients', lambda: IngredientSerializer(
+            Ingredient.objects.all(), many=True
+        ).data)
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return Response(self.reference_list())
+
 
 class TagViewSet(ReadOnlyModelViewSet):
     """Для работы с тегами."""
@@ -139,8 +283,20 @@ class TagViewSet(ReadOnlyModelViewSet):
     pagination_class = None
     permission_classes = (permissions.AllowAny,)
 
+    @staticmethod
+    def reference_list():
+        """Все теги из кеша справочников."""
+        return get_reference_list('tags', lambda: TagSerializer(
+            Tag.objects.all(), many=True
+        ).data)
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params:
+            return super().list(request, *args, **kwargs)
+        return Response(self.reference_list())
 
-class RecipeViewSet(ModelViewSet):
+
+class RecipeViewSet(SparseFieldsViewMixin, ModelViewSet):
     """Для работы с рецептами."""
 
     queryset = Recipe.objects.all()
@@ -149,8 +305,108 @@ class RecipeViewSet(ModelViewSet):
         AuthorOrReadOnly,
         permissions.IsAuthenticatedOrReadOnly
     )
+    deferrable_fields = DEFERRABLE_RECIPE_FIELDS
     filterset_class = RecipeFilter
     filter_backends = (DjangoFilterBackend,)
+    renderer_classes = (
+        *api_settings.DEFAULT_RENDERER_CLASSES, NormalizedJSONRenderer,
+    )
+    entities = None
+
+    def initial(self, request, *args, **kwargs):
+        """
+        Для ?format=normalized в списках рецептов заводятся словари
+        авторов, тегов и ингредиентов, общие для всех рецептов ответа.
+        """
+        super().initial(request, *args, **kwargs)
+        if (
+            self.action in NORMALIZED_ACTIONS
+            and request.accepted_renderer.format == NORMALIZED_FORMAT
+        ):
+            self.entities = OrderedDict(
+                (name, OrderedDict())
+                for name in ('authors', 'tags', 'ingredients')
+            )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['entities'] = self.entities
+        return context
+
+    def with_entities(self, data):
+        """Добавить к ответу словари объектов нормализованного режима."""
+        if self.entities is None:
+            return data
+        if isinstance(data, list):
+            data = OrderedDict(results=data)
+        data.update(self.entities)
+        return data
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data = self.with_entities(response.data)
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        """
+        Рецепт с небольшим числом зависимых строк (избранное, корзины,
+        ингредиенты) удаляется сразу, популярный — фоновой задачей:
+        ответ 202 со статусом задачи.
+        """
+        instance = self.get_object()
+        recipes = Recipe.objects.filter(pk=instance.pk)
+        if sum(deletion.cascade_count(recipes).values()) < DELETE_SYNC_MAX:
+            delete_recipes(recipes)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        job = tasks.delete_recipes.enqueue(
+            args=[[instance.pk]], user=request.user
+        )
+        return Response(
+            JobSerializer(job).data, status=status.HTTP_202_ACCEPTED
+        )
+
+    def list(self, request, *args, **kwargs):
+        """С ?facets=tags к странице добавляется число рецептов по тегам."""
+        facets = requested_facets(request)
+        response = super().list(request, *args, **kwargs)
+        if 'tags' in facets:
+            response.data['facets'] = OrderedDict(tags=self.tag_facets())
+        return response
+
+    def tag_facets(self):
+        """
+        Число рецептов по тегам при текущих фильтрах, кроме фильтра по
+        тегам, одним GROUP BY по связям рецептов с тегами. Без фильтров
+        по пользователю (избранное, корзина) счётчики берутся из кеша.
+        """
+        params = self.request.query_params.copy()
+        params.pop('tags', None)
+
+        def count():
+            links = Recipe.tags.through.objects.all()
+            if any(name in params for name in RecipeFilter.Meta.fields):
+                recipes = RecipeFilter(
+                    params, queryset=Recipe.objects.all(),
+                    request=self.request,
+                ).qs
+                links = links.filter(recipe__in=recipes.values('pk'))
+            return dict(
+                links.values_list('tag_id').annotate(Count('recipe_id'))
+            )
+
+        if any(name in params for name in FACET_USER_FILTERS):
+            counts = count()
+        else:
+            counts = get_recipe_facets(
+                'author={}'.format(params.get('author', '')), count
+            )
+        return [
+            OrderedDict(
+                id=tag['id'], slug=tag['slug'],
+                count=counts.get(tag['id'], 0),
+            )
+            for tag in TagViewSet.reference_list()
+        ]
 
     def add_to_list(self, request, pk, serializer_class):
         """Общая функция для добавления в избранное и в конзину."""
@@ -212,13 +468,6 @@ class RecipeViewSet(ModelViewSet):
             request, Cart, recipe, 'Рецепта нет в списке покупок!'
         )
 
-    def get_queryset(self):
-        """Оптимизация запросов к базе данных."""
-        recipes = Recipe.objects.prefetch_related(
-            'recipe_ingredients__ingredient', 'tags'
-        ).all()
-        return recipes
-
     def get_serializer_class(self):
         """Выбор сериализатора для рецептов."""
         if self.request.method in permissions.SAFE_METHODS:
@@ -250,10 +499,279 @@ class RecipeViewSet(ModelViewSet):
         """
         Формирует список уникальных ингредиентов и суммы их количества.
         """
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__carts__user=request.user
+        return self.ingredients_to_csv(self.cart_ingredients(request.user))
+
+    @staticmethod
+    def cart_ingredients(user):
+        """Суммы ингредиентов из корзины пользователя."""
+        return RecipeIngredient.objects.filter(
+            recipe__carts__user=user
         ).values(
             'ingredient__name',
             'ingredient__measurement_unit'
         ).annotate(ingredient_amount_sum=Sum('amount'))
-        return self.ingredients_to_csv(ingredients)
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='by_ingredients',
+        url_name='by_ingredients',
+    )
+    def by_ingredients(self, request):
+        """
+        Что приготовить из имеющихся ингредиентов: рецепты по убыванию
+        доли имеющихся ингредиентов и числу недостающих.
+        """
+        params = IngredientSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(ingredient_index.search(
+            params.validated_data['ingredients'],
+            params.validated_data.get('max_missing'),
+        ))
+        return self.get_paginated_response(
+            self.ranked_data(page, ('coverage', 'missing_count'))
+        )
+
+    @action(
+        detail=True,
+        methods=('get',),
+        url_path='similar',
+        url_name='similar',
+    )
+    def similar(self, request, pk):
+        """Рецепты с самым похожим набором ингредиентов."""
+        recipe = get_object_or_404(Recipe.objects.only('id'), id=pk)
+        params = SimilarRecipesSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(self.with_entities(self.ranked_data(
+            similarity_index.similar(
+                recipe.id, params.validated_data['limit']
+            ),
+            ('similarity',),
+        )))
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='changes',
+        url_name='changes',
+    )
+    def changes(self, request):
+        """
+        Лента изменений для синхронизации клиентов: рецепты, созданные
+        или изменённые после токена since, и id удалённых, по порядку
+        изменения. Последние RECIPE_SYNC_LAG секунд не отдаются, чтобы
+        не обогнать незафиксированные транзакции; строки, записанные в
+        более долгих транзакциях, отмечаются заново после фиксации
+        (recipes.signals.stamp_after_commit).
+        """
+        params = RecipeChangesSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        since = params.validated_data.get('since')
+        now = timezone.now()
+        horizon = now - timedelta(days=settings.RECIPE_TOMBSTONE_DAYS)
+        if since and since[0] < horizon:
+            return Response(
+                {'errors': 'Токен устарел, нужна полная синхронизация.'},
+                status=status.HTTP_410_GONE,
+            )
+        limit = params.validated_data['limit']
+        until = now - timedelta(seconds=settings.RECIPE_SYNC_LAG)
+        recipes = self.get_queryset().filter(
+            after_position('updated_at', 'id', since),
+            updated_at__lte=until,
+        ).order_by('updated_at', 'id')[:limit + 1]
+        deleted = RecipeTombstone.objects.filter(
+            after_position('deleted_at', 'recipe_id', since),
+            deleted_at__lte=until,
+        ).order_by('deleted_at', 'recipe_id').values_list(
+            'deleted_at', 'recipe_id'
+        )[:limit + 1]
+        events = list(islice(heapq.merge(
+            ((recipe.updated_at, recipe.id, recipe) for recipe in recipes),
+            ((moment, recipe_id, None) for moment, recipe_id in deleted),
+            key=itemgetter(0, 1),
+        ), limit + 1))
+        has_more = len(events) > limit
+        events = events[:limit]
+        changed = RecipeSerializer(
+            [recipe for _, _, recipe in events if recipe is not None],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+        return Response(self.with_entities(OrderedDict(
+            changed=changed,
+            deleted=[pk for _, pk, recipe in events if recipe is None],
+            next=(
+                sync_token(*events[-1][:2]) if events
+                else params.initial_data.get('since')
+            ),
+            has_more=has_more,
+        )))
+
+    @action(
+        detail=False,
+        methods=('get',),
+        url_path='export',
+        url_name='export',
+    )
+    def export(self, request):
+        """
+        Все рецепты с учётом фильтров, по одному JSON на строку (NDJSON).
+        Ответ отдаётся потоком, в памяти не больше одной пачки рецептов.
+        """
+        context = self.get_serializer_context()
+        context['store_fragments'] = False
+        return StreamingHttpResponse(
+            self.export_lines(
+                self.filter_queryset(self.get_queryset()), context
+            ),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+
+    @staticmethod
+    def export_lines(queryset, context):
+        """
+        Пачки по EXPORT_CHUNK_SIZE рецептов по возрастанию id: каждая
+        следующая пачка начинается после последнего id предыдущей, без
+        OFFSET и без курсора, открытого на всё время ответа.
+        """
+        encoder = JSONEncoder(ensure_ascii=False)
+        queryset = queryset.order_by('id')
+        last_id = 0
+        while True:
+            chunk = list(
+                queryset.filter(id__gt=last_id)[:EXPORT_CHUNK_SIZE]
+            )
+            if not chunk:
+                return
+            data = RecipeSerializer(chunk, many=True, context=context).data
+            for item in data:
+                yield encoder.encode(item) + '\n'
+            last_id = chunk[-1].id
+
+    def ranked_data(self, ranked, fields):
+        """
+        Рецепты из индекса в порядке ранжирования, к каждому добавляются
+        поля fields со значениями из индекса.
+        """
+        recipes = self.get_queryset().in_bulk(item[0] for item in ranked)
+        found = [item for item in ranked if item[0] in recipes]
+        data = RecipeSerializer(
+            [recipes[item[0]] for item in found],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+        for representation, item in zip(data, found):
+            representation.update(zip(fields, item[1:]))
+        return data
+
+
+class JobViewSet(ReadOnlyModelViewSet):
+    """Статусы фоновых задач: свои задачи, для staff — все."""
+
+    serializer_class = JobSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get_queryset(self):
+        if self.request.user.is_staff:
+            return Job.objects.all()
+        return self.request.user.jobs.all()
+
+
+class BatchView(APIView):
+    """
+    Несколько GET-запросов к API за один HTTP-запрос. Пользователь
+    определяется один раз, подзапросы вызывают представления напрямую,
+    без повторной аутентификации и без middleware. Ограничения
+    LoadSheddingMiddleware действуют на пакет целиком по его имени batch:
+    один слот CONCURRENCY_LIMITS и общий срок STATEMENT_TIMEOUTS на SQL
+    всех подзапросов; ограничения самих действий подзапросов не
+    применяются. Потоковые ответы в пакете не отдаются.
+    """
+
+    permission_classes = (permissions.AllowAny,)
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'responses': [
+            self.dispatch_one(request, item['path'])
+            for item in serializer.validated_data['requests']
+        ]})
+
+    def sub_request(self, request, url):
+        environ = {
+            key: value for key, value in request.META.items()
+            if not key.startswith('wsgi.')
+        }
+        environ.update({
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_LENGTH': '0',
+            'CONTENT_TYPE': '',
+            'wsgi.input': io.BytesIO(),
+            'wsgi.url_scheme': request.scheme,
+        })
+        sub_request = WSGIRequest(environ)
+        if request.user.is_authenticated:
+            sub_request._force_auth_user = request.user
+            sub_request._force_auth_token = request.auth
+        return sub_request
+
+    def dispatch_one(self, request, path):
+        """Ответ подзапроса: статус и тело в виде данных, а не текста."""
+        url = urlsplit(path)
+        try:
+            match = resolve(url.path)
+        except Resolver404:
+            return {'path': path, 'status': status.HTTP_404_NOT_FOUND,
+                    'body': {'detail': 'Страница не найдена.'}}
+        if getattr(match.func, 'view_class', None) is type(self):
+            return {'path': path, 'status': status.HTTP_400_BAD_REQUEST,
+                    'body': {'detail': 'Вложенные пакеты запрещены.'}}
+        view = match.func
+        if asyncio.iscoroutinefunction(view):
+            view = async_to_sync(view)
+        try:
+            response = view(
+                self.sub_request(request, url), *match.args, **match.kwargs
+            )
+        except Http404:
+            return {'path': path, 'status': status.HTTP_404_NOT_FOUND,
+                    'body': {'detail': 'Страница не найдена.'}}
+        except PermissionDenied:
+            return {'path': path, 'status': status.HTTP_403_FORBIDDEN,
+                    'body': {'detail': 'Доступ запрещён.'}}
+        if response.streaming:
+            response.close()
+            return {'path': path, 'status': status.HTTP_406_NOT_ACCEPTABLE,
+                    'body': {'detail': 'Потоковый ответ нельзя вернуть '
+                                       'в пакете.'}}
+        return {
+            'path': path,
+            'status': response.status_code,
+            'body': self.response_body(response),
+        }
+
+    @staticmethod
+    def response_body(response):
+        if isinstance(response, Response):
+            return response.data
+        content = response.content.decode(response.charset)
+        if 'json' in response.get('Content-Type', ''):
+            return json.loads(content) if content else None
+        return content
+
+
+class MetricsView(APIView):
+    """Метрики всех воркеров в формате Prometheus, только для staff."""
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            render_prometheus(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
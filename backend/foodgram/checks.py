@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core import checks
+from django.utils.module_loading import import_string
+
+PATH_PREFIX_MIDDLEWARE = 'foodgram.middleware.PathPrefixMiddleware'
+ADMIN_MIDDLEWARE = (
+    (
+        'django.contrib.auth.middleware.AuthenticationMiddleware',
+        'foodgram.E408',
+    ),
+    (
+        'django.contrib.messages.middleware.MessageMiddleware',
+        'foodgram.E409',
+    ),
+    (
+        'django.contrib.sessions.middleware.SessionMiddleware',
+        'foodgram.E410',
+    ),
+)
+
+
+def contains_subclass(class_path, candidate_paths):
+    """Как в django.contrib.admin.checks: подходят и наследники."""
+    expected = import_string(class_path)
+    for path in candidate_paths:
+        try:
+            candidate = import_string(path)
+        except ImportError:
+            continue
+        if issubclass(candidate, expected):
+            return True
+    return False
+
+
+@checks.register(checks.Tags.admin)
+def admin_middleware(app_configs, **kwargs):
+    """
+    Проверки admin.E408–E410 ищут middleware только в MIDDLEWARE и потому
+    выключены: админка получает их из SESSION_MIDDLEWARE внутри
+    PathPrefixMiddleware. Здесь те же проверки по итоговой цепочке.
+    """
+    if 'django.contrib.admin' not in settings.INSTALLED_APPS:
+        return []
+    stack = list(settings.MIDDLEWARE)
+    if PATH_PREFIX_MIDDLEWARE in stack:
+        stack += settings.SESSION_MIDDLEWARE
+    return [
+        checks.Error(
+            f'{path} должен быть в MIDDLEWARE или SESSION_MIDDLEWARE, '
+            'чтобы работала админка.',
+            id=error_id,
+        )
+        for path, error_id in ADMIN_MIDDLEWARE
+        if not contains_subclass(path, stack)
+    ]
@@ -1 +1,21 @@
 PAGE_SIZE = 6
+MAX_PAGE_SIZE = 100
+REPLICA_DB_ALIAS = 'replica'
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = 'primary_until'
+REPLICA_PIN_HEADER = 'X-Primary-Until'
+REPLICA_MAX_LAG = 5
+REPLICA_LAG_CHECK_INTERVAL = 2
+REPLICA_READ_PATHS = ('/api/batch/',)
+LEAN_MIDDLEWARE_PREFIXES = ('/api/',)
+WARMUP_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/1/',
+    '/api/recipes/download_shopping_cart/',
+    '/api/tags/',
+    '/api/ingredients/',
+    '/api/users/',
+    '/api/users/me/',
+    '/api/users/subscriptions/',
+    '/api/auth/token/login/',
+)
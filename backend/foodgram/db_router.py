@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+
+from contextvars import ContextVar
+
+from django.db import DatabaseError, connections
+
+from foodgram.constants import (
+    REPLICA_DB_ALIAS,
+    REPLICA_LAG_CHECK_INTERVAL,
+    REPLICA_MAX_LAG,
+)
+
+logger = logging.getLogger(__name__)
+
+read_from_replica = ContextVar('read_from_replica', default=False)
+
+POSTGRES_LAG_SQL = (
+    'SELECT CASE WHEN NOT pg_is_in_recovery() '
+    'OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+
+class ReplicaLagMonitor:
+    """Раз в несколько секунд проверяет отставание реплики."""
+
+    def __init__(self):
+        self.checked_at = None
+        self.fresh = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def can_measure():
+        """
+        Отставание измеряется только у PostgreSQL. Реплику другой базы
+        (например, копию файла SQLite) не читаем: её свежесть неизвестна.
+        """
+        return connections[REPLICA_DB_ALIAS].vendor == 'postgresql'
+
+    def measure_lag(self):
+        connection = connections[REPLICA_DB_ALIAS]
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL)
+            return cursor.fetchone()[0] or 0
+
+    def is_fresh(self):
+        now = time.monotonic()
+        with self.lock:
+            if (
+                self.checked_at is not None
+                and now - self.checked_at < REPLICA_LAG_CHECK_INTERVAL
+            ):
+                return self.fresh
+            self.checked_at = now
+        try:
+            lag = self.measure_lag()
+        except DatabaseError:
+            logger.warning('Реплика недоступна, чтение с основной базы.')
+            lag = None
+        fresh = lag is not None and lag <= REPLICA_MAX_LAG
+        if lag is not None and not fresh:
+            logger.warning('Отставание реплики %.1f с.', lag)
+        self.fresh = fresh
+        return fresh
+
+
+replica_monitor = ReplicaLagMonitor()
+
+
+class PrimaryReplicaRouter:
+    """
+    Чтение в безопасных запросах идёт на реплику, всё остальное —
+    на основную базу. Решение принимает ReplicaRoutingMiddleware.
+    """
+
+    def db_for_read(self, model, **hints):
+        if read_from_replica.get():
+            return REPLICA_DB_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
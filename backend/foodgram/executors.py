@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from asgiref.sync import sync_to_async
+
+db_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_DB_THREADS,
+    thread_name_prefix='foodgram-db',
+)
+
+request_wrappers = ContextVar('request_wrappers', default=())
+
+
+def run_request_wrappers(execute, sql, params, many, context):
+    """
+    Постоянная обёртка каждого соединения: SQL-запрос проходит через
+    обёртки текущего HTTP-запроса, в каком бы потоке он ни выполнялся.
+    """
+    for wrapper in request_wrappers.get():
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_wrapper(connection, wrapper):
+    """
+    Постоянная обёртка соединения. Ставится в начало списка:
+    connection.execute_wrapper() снимает последнюю.
+    """
+    if wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, wrapper)
+
+
+@contextmanager
+def query_wrappers(*wrappers):
+    """
+    Обёртки execute_wrapper для всех SQL-запросов текущего контекста:
+    в потоке запроса, в потоке синхронных представлений ASGI и в пуле
+    database_sync_to_async, куда контекст копируется asgiref.
+    """
+    token = request_wrappers.set(request_wrappers.get() + wrappers)
+    try:
+        yield
+    finally:
+        request_wrappers.reset(token)
+
+
+def database_sync_to_async(func):
+    """
+    Выполняет синхронный код с ORM в ограниченном пуле потоков.
+
+    Число одновременных обращений к базе из одного ASGI-процесса
+    не превышает ASYNC_DB_THREADS, устаревшие соединения закрываются
+    так же, как по окончании обычного запроса. Обёртки query_wrappers
+    запроса действуют и здесь.
+    """
+
+    @wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False, executor=db_executor)
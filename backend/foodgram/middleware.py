@@ -0,0 +1,208 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.exception import convert_exception_to_response
+from django.utils.module_loading import import_string
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from foodgram.constants import (
+    LEAN_MIDDLEWARE_PREFIXES,
+    REPLICA_DB_ALIAS,
+    REPLICA_PIN_COOKIE,
+    REPLICA_PIN_HEADER,
+    REPLICA_PIN_SECONDS,
+    REPLICA_READ_PATHS,
+)
+from foodgram.db_router import read_from_replica, replica_monitor
+from foodgram.executors import database_sync_to_async
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class DualModeMiddleware:
+    """
+    Основа middleware для WSGI и ASGI без адаптации через потоки.
+
+    Если следующий обработчик асинхронный, экземпляр помечается как
+    корутинная функция и вызов уходит в __acall__, иначе в handle.
+    Наследники реализуют оба метода.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+
+class ReplicaRoutingMiddleware(DualModeMiddleware):
+    """
+    Направляет чтение безопасных запросов на реплику.
+
+    После успешной записи клиент закрепляется за основной базой на
+    REPLICA_PIN_SECONDS: срок передаётся в cookie и в заголовке, который
+    клиенты без cookie могут прислать обратно. POST на пути из
+    REPLICA_READ_PATHS только читает данные и тоже идёт на реплику.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = REPLICA_DB_ALIAS in settings.DATABASES
+        if self.enabled and not replica_monitor.can_measure():
+            logger.warning(
+                'Отставание реплики %s не измерить, чтение с основной базы.',
+                settings.DATABASES[REPLICA_DB_ALIAS]['ENGINE'],
+            )
+            self.enabled = False
+
+    def is_pinned(self, request):
+        until = (
+            request.COOKIES.get(REPLICA_PIN_COOKIE)
+            or request.headers.get(REPLICA_PIN_HEADER)
+        )
+        try:
+            return float(until) > time.time()
+        except (TypeError, ValueError):
+            return False
+
+    def is_read_only(self, request):
+        return (
+            request.method in SAFE_METHODS
+            or request.path in REPLICA_READ_PATHS
+        )
+
+    def use_replica(self, request):
+        return (
+            self.is_read_only(request)
+            and not self.is_pinned(request)
+            and replica_monitor.is_fresh()
+        )
+
+    def pin_to_primary(self, request, response):
+        if not self.is_read_only(request) and response.status_code < 400:
+            until = str(int(time.time()) + REPLICA_PIN_SECONDS)
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, until,
+                max_age=REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+            response[REPLICA_PIN_HEADER] = until
+        return response
+
+    def handle(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        token = read_from_replica.set(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        return self.pin_to_primary(request, response)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        use_replica = await database_sync_to_async(self.use_replica)(request)
+        token = read_from_replica.set(use_replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_from_replica.reset(token)
+        return self.pin_to_primary(request, response)
+
+
+class PathPrefixMiddleware(DualModeMiddleware):
+    """
+    Middleware из settings.SESSION_MIDDLEWARE для всех путей, кроме
+    LEAN_MIDDLEWARE_PREFIXES. API аутентифицируется только токеном:
+    сессии, CSRF, сообщения и X-Frame-Options нужны админке, а не ему.
+    Запрос к API с cookie сессии (браузер, вошедший в админку или в
+    browsable API) проходит полную цепочку, чтобы сессия и CSRF
+    работали и там.
+
+    Внутренняя цепочка собирается как в BaseHandler.load_middleware,
+    её process_view, process_template_response и process_exception
+    вызываются из одноимённых методов этого middleware и только для
+    запросов, прошедших через неё.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.prefixes = (
+            LEAN_MIDDLEWARE_PREFIXES if settings.LEAN_API_MIDDLEWARE else ()
+        )
+        self.view_middleware = []
+        self.template_response_middleware = []
+        self.exception_middleware = []
+        handler = get_response
+        for middleware_path in reversed(settings.SESSION_MIDDLEWARE):
+            try:
+                middleware = import_string(middleware_path)(handler)
+            except MiddlewareNotUsed:
+                continue
+            if hasattr(middleware, 'process_view'):
+                self.view_middleware.insert(0, middleware.process_view)
+            if hasattr(middleware, 'process_template_response'):
+                self.template_response_middleware.append(
+                    middleware.process_template_response
+                )
+            if hasattr(middleware, 'process_exception'):
+                self.exception_middleware.append(
+                    middleware.process_exception
+                )
+            handler = convert_exception_to_response(middleware)
+        self.full_stack = handler
+
+    def is_lean(self, request):
+        return (
+            request.path_info.startswith(self.prefixes)
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        )
+
+    def __call__(self, request):
+        # Обе ветки в режиме ASGI сами возвращают корутину.
+        if self.is_lean(request):
+            return self.get_response(request)
+        return self.full_stack(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.is_lean(request):
+            return None
+        for method in self.view_middleware:
+            response = method(request, view_func, view_args, view_kwargs)
+            if response is not None:
+                return response
+        return None
+
+    def process_template_response(self, request, response):
+        if not self.is_lean(request):
+            for method in self.template_response_middleware:
+                response = method(request, response)
+        return response
+
+    def process_exception(self, request, exception):
+        if self.is_lean(request):
+            return None
+        for method in self.exception_middleware:
+            response = method(request, exception)
+            if response is not None:
+                return response
+        return None
@@ -32,18 +32,37 @@ INSTALLED_APPS = [
     'drf_spectacular',
     'users.apps.UsersConfig',
     'recipes.apps.RecipesConfig',
+    'api.apps.ApiConfig',
+    'jobs.apps.JobsConfig',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.QueryInstrumentationMiddleware',
+    'api.middleware.SlowQueryMiddleware',
+    'api.middleware.LoadSheddingMiddleware',
+    'foodgram.middleware.ReplicaRoutingMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'foodgram.middleware.PathPrefixMiddleware',
+    'api.middleware.ProfilingMiddleware',
+]
+
+# Выполняются внутри PathPrefixMiddleware для всех путей, кроме /api/.
+SESSION_MIDDLEWARE = [
+    'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+LEAN_API_MIDDLEWARE = os.getenv('LEAN_API_MIDDLEWARE', 'True') == 'True'
+
+# Проверки админки ищут эти middleware только в MIDDLEWARE; их замена
+# по MIDDLEWARE и SESSION_MIDDLEWARE — foodgram.checks.
+SILENCED_SYSTEM_CHECKS = ['admin.E408', 'admin.E409', 'admin.E410']
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -64,6 +83,12 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+ASYNC_API = os.getenv('SERVER_MODE') == 'asgi'
+
+ASYNC_DB_THREADS = int(os.getenv('ASYNC_DB_THREADS', 8))
+
 
 if os.getenv('USE_SQLITE'):
     DATABASES = {
@@ -72,6 +97,12 @@ if os.getenv('USE_SQLITE'):
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+    if os.getenv('SQLITE_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / os.getenv('SQLITE_REPLICA_NAME'),
+            'TEST': {'MIRROR': 'default'},
+        }
 else:
     DATABASES = {
         'default': {
@@ -83,6 +114,48 @@ else:
             'PORT': os.getenv('DB_PORT', 5432)
         }
     }
+    if os.getenv('DB_REPLICA_HOST') or os.getenv('DB_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+            'HOST': os.getenv('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+            'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+
+DATABASE_ROUTERS = ['foodgram.db_router.PrimaryReplicaRouter']
+
+# Кеш общий для всех процессов, которые пишут в базу, включая воркеры
+# фоновых задач: через него идут сбросы фрагментов и фасетов и лента
+# изменений рецептов. В docker-compose это том cache у backend и worker.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'
+)
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache')
+# Версии каталога, фасетов и номер ленты изменений живут в отдельном
+# кеше с парой ключей: вытеснение фрагментов рецептов их не задевает.
+VERSIONS_CACHE_LOCATION = os.getenv(
+    'VERSIONS_CACHE_LOCATION',
+    f'{CACHE_LOCATION}_versions' if CACHE_BACKEND.endswith(
+        'FileBasedCache'
+    ) else CACHE_LOCATION,
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION,
+    },
+    'versions': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': VERSIONS_CACHE_LOCATION,
+        'KEY_PREFIX': 'versions',
+    },
+}
+if CACHE_BACKEND.endswith(('FileBasedCache', 'LocMemCache', 'DatabaseCache')):
+    # Без лимита Django держит 300 ключей, а фрагмент — ключ на рецепт.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 200000)),
+    }
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -125,11 +198,104 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageLimitPagination',
 }
 
+SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION') == 'True'
+
+SQL_QUERY_BUDGETS = {
+    'recipes-list': 10,
+    'recipes-detail': 8,
+    'recipes-download_shopping_cart': 3,
+    'users-list': 10,
+    'users-subscriptions': 10,
+    'ingredients-list': 3,
+    'tags-list': 3,
+}
+
+SQL_QUERY_BUDGET_ACTION = 'raise' if DEBUG else 'warn'
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+
+METRICS_DIR = os.getenv('METRICS_DIR', '/tmp/foodgram_metrics')
+
+METRICS_FLUSH_INTERVAL = 5
+
+SLOW_QUERY_LOGGING = os.getenv('SLOW_QUERY_LOGGING') == 'True'
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+
+SLOW_QUERY_EXPLAIN_ANALYZE = (
+    os.getenv('SLOW_QUERY_EXPLAIN_ANALYZE') == 'True'
+)
+
+SLOW_QUERY_LOG = os.getenv(
+    'SLOW_QUERY_LOG', '/tmp/foodgram_slow_queries.jsonl'
+)
+
+SIMILARITY_INDEX_PATH = os.getenv(
+    'SIMILARITY_INDEX_PATH', '/tmp/foodgram_similarity.npz'
+)
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED') == 'True'
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0.01))
+
+PROFILING_DIR = os.getenv('PROFILING_DIR', '/tmp/foodgram_profiles')
+
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', 200))
+
+JOBS_WORKER_PROCESSES = int(os.getenv('JOBS_WORKER_PROCESSES', 1))
+
+JOBS_WORKER_THREADS = int(os.getenv('JOBS_WORKER_THREADS', 4))
+
+JOBS_POLL_INTERVAL = float(os.getenv('JOBS_POLL_INTERVAL', 1))
+
+RECIPE_TOMBSTONE_DAYS = int(os.getenv('RECIPE_TOMBSTONE_DAYS', 30))
+
+# Сколько секунд /api/recipes/changes/ ждёт незафиксированные записи.
+# Должно превышать расхождение часов серверов приложения: запись,
+# отмеченная отстающим сервером, иначе окажется позади токенов клиентов.
+RECIPE_SYNC_LAG = int(os.getenv('RECIPE_SYNC_LAG', 5))
+
+LOAD_SHEDDING = os.getenv('LOAD_SHEDDING', 'True') == 'True'
+
+LOAD_SHED_DIR = os.getenv('LOAD_SHED_DIR', '/tmp/foodgram_slots')
+
+STATEMENT_TIMEOUTS = {
+    'recipes-list': 5,
+    'recipes-by_ingredients': 5,
+    'recipes-similar': 5,
+    'recipes-changes': 10,
+    'recipes-download_shopping_cart': 10,
+    'users-subscriptions': 5,
+    'batch': 10,
+}
+
+CONCURRENCY_LIMITS = {
+    'recipes-download_shopping_cart': 4,
+    'recipes-export': 2,
+    'recipes-by_ingredients': 8,
+    'recipes-similar': 8,
+    'recipes-changes': 8,
+    'batch': 8,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO'},
+        'foodgram': {'handlers': ['console'], 'level': 'INFO'},
+        'jobs': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 DJOSER = {
     "LOGIN_FIELD": 'email',
     "SEND_ACTIVATION_EMAIL": False,
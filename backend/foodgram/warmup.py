@@ -0,0 +1,89 @@
+"""
+Прогрев приложения до первых запросов.
+
+С preload_app gunicorn прогрев выполняется один раз в мастере до fork,
+после чего соединения с базой закрываются: воркеры открывают свои.
+Без preload каждый воркер прогревается сам при старте.
+"""
+import json
+import logging
+import time
+
+from django.db import DatabaseError, connections
+from django.urls import Resolver404, get_resolver, resolve
+
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+from api import serializers
+from api.recipe_index import ingredient_index, similarity_index
+from api.views import IngredientViewSet, TagViewSet
+from foodgram.constants import WARMUP_PATHS
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_urls():
+    """Сборка маршрутов, в том числе router и djoser."""
+    get_resolver().reverse_dict
+    for path in WARMUP_PATHS:
+        try:
+            resolve(path)
+        except Resolver404:
+            continue
+
+
+def build_serializers():
+    """Поля всех сериализаторов API и метаданные их моделей."""
+    for value in vars(serializers).values():
+        if (
+            isinstance(value, type)
+            and issubclass(value, BaseSerializer)
+            and not issubclass(value, ListSerializer)
+            and value.__module__ == serializers.__name__
+        ):
+            value().fields
+
+
+def build_reference_data():
+    """Кеш справочников: теги и ингредиенты."""
+    TagViewSet.reference_list()
+    IngredientViewSet.reference_list()
+
+
+def build_recipe_indexes():
+    """Индексы рецептов в памяти: в мастере они общие для воркеров."""
+    ingredient_index.refresh()
+    similarity_index.refresh()
+
+
+def open_connections():
+    for alias in connections:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            logger.warning('Нет соединения с базой %s: %s', alias, error)
+
+
+STAGES = (
+    ('urls', resolve_urls),
+    ('serializers', build_serializers),
+    ('reference_data', build_reference_data),
+    ('recipe_indexes', build_recipe_indexes),
+    ('connections', open_connections),
+)
+
+
+def warm_up(before_fork=False):
+    """Выполнить все этапы и записать их длительность в лог."""
+    timings = {}
+    for name, stage in STAGES:
+        started = time.perf_counter()
+        try:
+            stage()
+        except DatabaseError as error:
+            logger.warning('Прогрев %s не выполнен: %s', name, error)
+        timings[name] = round((time.perf_counter() - started) * 1000, 2)
+    if before_fork:
+        connections.close_all()
+    logger.info(json.dumps({'warmup_ms': timings}))
+    return timings
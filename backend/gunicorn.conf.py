@@ -0,0 +1,37 @@
+import os
+
+bind = '0.0.0.0:7000'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+if os.getenv('SERVER_MODE') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+
+def when_ready(server):
+    """Прогрев в мастере до запуска воркеров."""
+    if preload_app:
+        from foodgram.warmup import warm_up
+
+        warm_up(before_fork=True)
+
+
+def post_worker_init(worker):
+    """Соединения с базой воркера; без preload — полный прогрев."""
+    from foodgram import warmup
+
+    if preload_app:
+        warmup.open_connections()
+    else:
+        warmup.warm_up()
+
+
+def child_exit(server, worker):
+    """Метрики завершившегося воркера переносятся в архив."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    from api import metrics
+
+    metrics.mark_process_dead(worker.pid)
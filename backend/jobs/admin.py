@@ -0,0 +1,13 @@
+from django.contrib import admin
+
+from jobs.models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'name', 'status', 'attempts', 'user', 'run_at', 'created',
+        'finished',
+    )
+    list_filter = ('status', 'name')
+    readonly_fields = ('locked_by', 'locked_at', 'created', 'finished')
@@ -0,0 +1,10 @@
+MAX_LENGTH_NAME = 100
+MAX_LENGTH_STATUS = 10
+MAX_LENGTH_WORKER = 100
+MAX_LENGTH_ERROR = 1000
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 10
+RETRY_BACKOFF_MAX = 60 * 60
+LOCK_TIMEOUT = 60 * 10
+HEARTBEAT_INTERVAL = 60
+CLAIM_CANDIDATES = 10
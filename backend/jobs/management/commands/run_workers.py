@@ -0,0 +1,88 @@
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.constans import LOCK_TIMEOUT
+from jobs.worker import requeue_stale, work
+
+
+def run_threads(threads, poll_interval, burst):
+    """
+    Пул потоков в текущем процессе, SIGTERM завершает его мягко:
+    потоки дорабатывают текущие задачи. Основной поток раз в
+    LOCK_TIMEOUT возвращает в очередь задачи упавших воркеров.
+    """
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *args: stop.set())
+    pool = [
+        threading.Thread(
+            target=work, args=(stop, poll_interval, burst), daemon=True
+        )
+        for _ in range(threads)
+    ]
+    for thread in pool:
+        thread.start()
+    requeued_at = time.monotonic()
+    while any(thread.is_alive() for thread in pool):
+        for thread in pool:
+            thread.join(poll_interval)
+        if time.monotonic() - requeued_at > LOCK_TIMEOUT:
+            requeue_stale()
+            requeued_at = time.monotonic()
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    """
+    Воркеры очереди задач: processes процессов по threads потоков.
+    Задачи с вводом-выводом выгоднее выполнять потоками, задачи
+    с тяжёлыми вычислениями — процессами.
+    """
+    help = 'Запустить воркеры фоновых задач.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=settings.JOBS_WORKER_PROCESSES
+        )
+        parser.add_argument(
+            '--threads', type=int, default=settings.JOBS_WORKER_THREADS
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Завершиться, когда очередь опустеет.',
+        )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь задач: {requeued}.')
+        worker_args = (
+            options['threads'], options['poll_interval'], options['burst']
+        )
+        if options['processes'] <= 1:
+            run_threads(*worker_args)
+            return
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_threads, args=worker_args)
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(
+                signum,
+                lambda *args: [process.terminate() for process in processes],
+            )
+        for process in processes:
+            process.join()
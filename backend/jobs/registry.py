@@ -0,0 +1,66 @@
+"""
+Реестр фоновых задач.
+
+Задача — обычная функция в модуле tasks.py любого приложения:
+
+    @task()
+    def build_snapshot(seq):
+        ...
+
+    build_snapshot.enqueue(args=[seq], user=request.user)
+
+Задача ставится в очередь записью в таблицу jobs в текущей транзакции:
+при откате транзакции задача тоже исчезает, а воркеры видят её только
+после коммита. Долгая задача сообщает прогресс через
+report_progress(done=..., total=...).
+"""
+import datetime
+import threading
+
+from django.utils import timezone
+
+from jobs.constans import MAX_ATTEMPTS
+from jobs.models import Job
+
+tasks = {}
+current = threading.local()
+
+
+def task(name=None, max_attempts=MAX_ATTEMPTS):
+    """Зарегистрировать функцию как фоновую задачу."""
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.enqueue = lambda **options: enqueue(task_name, **options)
+        tasks[task_name] = func
+        return func
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, user=None, delay=0):
+    """Поставить задачу в очередь, delay — отсрочка в секундах."""
+    func = tasks.get(name)
+    if func is None:
+        raise LookupError(f'Задача {name} не зарегистрирована.')
+    return Job.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        user=user if user and user.is_authenticated else None,
+        max_attempts=func.max_attempts,
+        run_at=timezone.now() + datetime.timedelta(seconds=delay),
+    )
+
+
+def report_progress(**progress):
+    """
+    Промежуточный результат выполняемой задачи, виден в /api/jobs/{id}/
+    до её завершения; заодно продлевает блокировку задачи. Вне воркера
+    ничего не делает.
+    """
+    job = getattr(current, 'job', None)
+    if job is not None:
+        Job.objects.filter(id=job.id, locked_by=job.locked_by).update(
+            result=progress, locked_at=timezone.now()
+        )
@@ -0,0 +1,218 @@
+"""
+Выполнение задач из таблицы jobs.
+
+На PostgreSQL задачи захватываются через SELECT ... FOR UPDATE SKIP
+LOCKED: воркеры не ждут друг друга и не берут одну задачу дважды.
+SQLite не умеет блокировать строки, там задача захватывается условным
+UPDATE по статусу: запись в SQLite идёт под блокировкой всей базы,
+поэтому обновить строку успевает только один воркер.
+"""
+import datetime
+import logging
+import os
+import random
+import socket
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections
+from django.db.models import F
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from jobs.constans import (
+    CLAIM_CANDIDATES,
+    HEARTBEAT_INTERVAL,
+    LOCK_TIMEOUT,
+    MAX_LENGTH_ERROR,
+    RETRY_BACKOFF,
+    RETRY_BACKOFF_MAX,
+)
+from jobs.models import Job
+from jobs.registry import current, tasks
+
+logger = logging.getLogger(__name__)
+
+
+def worker_id():
+    return '{}:{}:{}'.format(
+        socket.gethostname(), os.getpid(), threading.get_ident()
+    )
+
+
+def claim(worker, limit=1):
+    """Захватить до limit задач, готовых к запуску."""
+    now = timezone.now()
+    queued = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).order_by('run_at', 'id')
+    running = {
+        'status': Job.RUNNING,
+        'locked_by': worker,
+        'locked_at': now,
+        'attempts': F('attempts') + 1,
+    }
+    connection = connections[queued.db]
+    if connection.features.has_select_for_update_skip_locked:
+        with atomic(using=queued.db):
+            ids = list(queued.select_for_update(
+                skip_locked=True
+            ).values_list('id', flat=True)[:limit])
+            Job.objects.filter(id__in=ids).update(**running)
+    else:
+        ids = []
+        candidates = queued.values_list('id', flat=True)
+        for pk in candidates[:limit * CLAIM_CANDIDATES]:
+            if Job.objects.filter(id=pk, status=Job.QUEUED).update(**running):
+                ids.append(pk)
+                if len(ids) == limit:
+                    break
+    return list(Job.objects.filter(id__in=ids))
+
+
+def backoff(attempts):
+    """Пауза перед повтором: экспонента со случайным разбросом."""
+    delay = min(RETRY_BACKOFF * 2 ** (attempts - 1), RETRY_BACKOFF_MAX)
+    return datetime.timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+def owned(job):
+    """Задача, пока её не перехватил другой воркер после requeue_stale."""
+    return Job.objects.filter(
+        id=job.id, status=Job.RUNNING, locked_by=job.locked_by
+    )
+
+
+class Heartbeat(threading.Thread):
+    """
+    Пока задача выполняется, раз в HEARTBEAT_INTERVAL секунд продлевает
+    её блокировку: requeue_stale не вернёт в очередь живую задачу, как бы
+    долго она ни шла.
+    """
+
+    def __init__(self, job):
+        super().__init__(name=f'heartbeat-{job.pk}', daemon=True)
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(HEARTBEAT_INTERVAL):
+                try:
+                    if not owned(self.job).update(locked_at=timezone.now()):
+                        return
+                except DatabaseError as error:
+                    logger.warning(
+                        'Не удалось продлить задачу #%s: %s',
+                        self.job.pk, error,
+                    )
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run(job):
+    """
+    Выполнить задачу и записать результат или ошибку. Итог пишется,
+    только если задача всё ещё за этим воркером.
+    """
+    heartbeat = Heartbeat(job)
+    heartbeat.start()
+    try:
+        func = tasks.get(job.name)
+        if func is None:
+            raise LookupError(f'Задача {job.name} не зарегистрирована.')
+        current.job = job
+        result = func(*job.args, **job.kwargs)
+    except Exception as error:
+        logger.exception('Задача %s #%s упала', job.name, job.pk)
+        message = f'{type(error).__name__}: {error}'[:MAX_LENGTH_ERROR]
+        if job.attempts < job.max_attempts:
+            updated = owned(job).update(
+                status=Job.QUEUED,
+                error=message,
+                run_at=timezone.now() + backoff(job.attempts),
+                locked_by='',
+                locked_at=None,
+            )
+        else:
+            updated = owned(job).update(
+                status=Job.FAILED, error=message, finished=timezone.now()
+            )
+        if not updated:
+            lost(job)
+        return False
+    finally:
+        current.job = None
+        heartbeat.stop()
+    finished = owned(job)
+    try:
+        updated = finished.update(
+            status=Job.DONE, result=result, error='', finished=timezone.now()
+        )
+    except TypeError:
+        updated = finished.update(
+            status=Job.DONE, result=repr(result), error='',
+            finished=timezone.now(),
+        )
+    if not updated:
+        lost(job)
+        return False
+    return True
+
+
+def lost(job):
+    logger.warning(
+        'Задача %s #%s уже не принадлежит воркеру %s, итог не записан',
+        job.name, job.pk, job.locked_by,
+    )
+
+
+def requeue_stale():
+    """
+    Вернуть в очередь задачи воркеров, которые упали, не завершив их:
+    живой воркер продлевает блокировку (Heartbeat), а у упавшего она
+    старше LOCK_TIMEOUT. Задачи без оставшихся попыток помечаются ошибкой.
+    """
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - datetime.timedelta(
+            seconds=LOCK_TIMEOUT
+        ),
+    )
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED,
+        error='Воркер не завершил задачу.',
+        finished=timezone.now(),
+    )
+    return stale.update(status=Job.QUEUED, locked_by='', locked_at=None)
+
+
+def work(stop, poll_interval=None, burst=False):
+    """
+    Цикл одного потока: брать задачи, пока не выставлен stop.
+    В режиме burst поток завершается, когда очередь пуста.
+    """
+    poll_interval = poll_interval or settings.JOBS_POLL_INTERVAL
+    worker = worker_id()
+    try:
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                jobs = claim(worker)
+            except DatabaseError as error:
+                logger.warning('Очередь задач недоступна: %s', error)
+                stop.wait(poll_interval)
+                continue
+            if not jobs:
+                if burst:
+                    break
+                stop.wait(poll_interval)
+                continue
+            for job in jobs:
+                run(job)
+    finally:
+        connections.close_all()
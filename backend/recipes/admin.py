@@ -1,13 +1,18 @@
 from django.contrib import admin
 
+from api import tasks
+from api.admin import FastDeleteAdminMixin
+from api.deletion import delete_recipes
 from recipes.constans import MIN_VALUE
 from recipes.models import (
     Cart,
     Favorite,
     Follow,
+    ImageBlob,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeTombstone,
     Tag,
 )
 
@@ -19,10 +24,12 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(FastDeleteAdminMixin, admin.ModelAdmin):
+    delete_function = staticmethod(delete_recipes)
+    delete_task = tasks.delete_recipes
     list_display = (
         'name', 'author', 'get_tags', 'get_ingredients', 'count_favorites',
-        'pub_date',
+        'pub_date', 'updated_at',
     )
     list_filter = ('name', 'author__username', 'tags')
     inlines = (RecipeIngredientInline,)
@@ -65,3 +72,16 @@ class FollowAdmin(admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'size', 'refcount', 'touched')
+    list_filter = ('refcount',)
+    search_fields = ('name',)
+
+
+@admin.register(RecipeTombstone)
+class RecipeTombstoneAdmin(admin.ModelAdmin):
+    list_display = ('recipe_id', 'deleted_at')
+    search_fields = ('recipe_id',)
@@ -3,3 +3,6 @@ MAX_LENGTH_NAME = 200
 MAX_LENGTH_COLOR = 7
 PATH_DB_IMPORT_DATA_TAG = 'data/tags.csv'
 PATH_DB_IMPORT_DATA_ING = 'data/ingredients.csv'
+MAX_LENGTH_IMAGE_NAME = 255
+IMAGE_HASH_PREFIX = 2
+IMAGE_GC_GRACE = 60 * 60
@@ -0,0 +1,136 @@
+import datetime
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from recipes.constans import IMAGE_GC_GRACE
+from recipes.models import ImageBlob, Recipe
+from recipes.storage import is_hashed
+
+
+class Command(BaseCommand):
+    """
+    Сборка мусора в хранилище изображений: удаляются файлы без ссылок
+    рецептов, к которым не обращались дольше grace секунд. Пауза нужна,
+    чтобы не удалить файл, который только что загружен, а рецепт с ним
+    ещё не сохранён.
+    """
+    help = 'Удалить изображения, на которые не ссылаются рецепты.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=IMAGE_GC_GRACE)
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Пересчитать счётчики ссылок по таблице рецептов.',
+        )
+        parser.add_argument(
+            '--adopt', action='store_true',
+            help='Перенести старые файлы рецептов в хранилище по хешу.',
+        )
+
+    def handle(self, *args, **options):
+        self.field = Recipe._meta.get_field('image')
+        self.storage = self.field.storage
+        self.dry_run = options['dry_run']
+        cutoff = timezone.now() - datetime.timedelta(seconds=options['grace'])
+        if options['adopt']:
+            self.adopt()
+        if options['recount'] or options['adopt']:
+            self.recount()
+        blobs, blob_bytes = self.collect_blobs(cutoff)
+        files, file_bytes = self.collect_orphans(cutoff)
+        self.stdout.write(self.style.SUCCESS(
+            '{}: файлов без ссылок {}, прочих файлов {}, {:.1f} МБ.'.format(
+                'Будет удалено' if self.dry_run else 'Удалено',
+                blobs,
+                files,
+                (blob_bytes + file_bytes) / 2 ** 20,
+            )
+        ))
+
+    def adopt(self):
+        """Пересохранить рецепты со старыми именами файлов."""
+        legacy = [
+            recipe for recipe in Recipe.objects.exclude(image='').iterator()
+            if not is_hashed(recipe.image.name)
+        ]
+        for recipe in legacy:
+            name = recipe.image.name
+            if self.dry_run or not self.storage.exists(name):
+                continue
+            with self.storage.open(name) as content:
+                recipe.image.save(os.path.basename(name), File(content))
+            if not Recipe.objects.filter(image=name).exists():
+                self.storage.delete(name)
+        self.stdout.write(f'Старых изображений: {len(legacy)}.')
+
+    def recount(self):
+        counts = dict(Recipe.objects.order_by().values_list('image').annotate(
+            count=Count('id')
+        ))
+        for name in counts:
+            if is_hashed(name) and self.storage.exists(name):
+                ImageBlob.objects.get_or_create(
+                    name=name, defaults={'size': self.storage.size(name)}
+                )
+        fixed = 0
+        for blob in ImageBlob.objects.iterator():
+            if blob.refcount != counts.get(blob.name, 0):
+                fixed += ImageBlob.objects.filter(pk=blob.pk).update(
+                    refcount=counts.get(blob.name, 0)
+                )
+        self.stdout.write(f'Исправлено счётчиков ссылок: {fixed}.')
+
+    def collect_blobs(self, cutoff):
+        """
+        Удаление строки и файла в одной транзакции: хранилище при
+        повторной загрузке того же файла ждёт блокировки строки и
+        записывает файл заново.
+        """
+        candidates = ImageBlob.objects.filter(
+            refcount__lte=0, touched__lt=cutoff
+        )
+        referenced = set(Recipe.objects.filter(
+            image__in=candidates.values('name')
+        ).values_list('image', flat=True))
+        removed = removed_bytes = 0
+        for blob in candidates.exclude(name__in=referenced).iterator():
+            if self.dry_run:
+                removed, removed_bytes = removed + 1, removed_bytes + blob.size
+                continue
+            with transaction.atomic():
+                deleted, _ = candidates.filter(pk=blob.pk).delete()
+                if deleted:
+                    self.storage.delete(blob.name)
+                    removed += 1
+                    removed_bytes += blob.size
+        return removed, removed_bytes
+
+    def collect_orphans(self, cutoff):
+        """Файлы на диске, о которых не знают ни рецепты, ни ImageBlob."""
+        root = self.storage.path(self.field.upload_to)
+        known = set(ImageBlob.objects.values_list('name', flat=True))
+        known.update(Recipe.objects.values_list('image', flat=True))
+        removed = removed_bytes = 0
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(
+                    path, self.storage.location
+                ).replace(os.sep, '/')
+                stat = os.stat(path)
+                modified = datetime.datetime.fromtimestamp(
+                    stat.st_mtime, datetime.timezone.utc
+                )
+                if name in known or modified >= cutoff:
+                    continue
+                if not self.dry_run:
+                    os.unlink(path)
+                removed += 1
+                removed_bytes += stat.st_size
+        return removed, removed_bytes
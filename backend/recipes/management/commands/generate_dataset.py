@@ -0,0 +1,256 @@
+import io
+import random
+
+from collections import Counter
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from PIL import Image
+from tqdm import tqdm
+
+from api.cache import (
+    bump_catalog_version,
+    bump_recipe_facets_version,
+    record_recipe_changes,
+)
+from recipes.models import (
+    Cart,
+    Favorite,
+    Follow,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    Tag,
+)
+from recipes.storage import change_references
+from users.models import User
+
+PLACEHOLDER_NAME = 'recipes/placeholder_{number}.png'
+USERNAME_PREFIX = 'user'
+EMAIL_DOMAIN = '@example.com'
+
+
+def zipf_cum_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для random.choices."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+class Command(BaseCommand):
+    """
+    Django-команда для генерации тестовых данных в объёмах продакшена.
+    """
+    help = 'Генерация пользователей, рецептов, избранного, корзин и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--favorites', type=float, default=20,
+                            help='Среднее число избранных на пользователя.')
+        parser.add_argument('--carts', type=float, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--follows', type=float, default=10,
+                            help='Среднее число подписок на пользователя.')
+        parser.add_argument('--images', type=int, default=20,
+                            help='Число картинок-заглушек.')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения популярности.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def create_in_batches(self, model, objects, desc):
+        """Вставка пачками, генератор objects не держится в памяти целиком."""
+        batch = []
+        with tqdm(desc=desc) as pbar:
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) >= self.batch_size:
+                    model.objects.bulk_create(batch)
+                    pbar.update(len(batch))
+                    batch = []
+            if batch:
+                model.objects.bulk_create(batch)
+                pbar.update(len(batch))
+
+    def new_ids(self, model, last_id):
+        return list(
+            model.objects.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def create_placeholders(self, count):
+        """
+        Картинки сохраняются в хранилище поля image: имена по хешу и
+        строки ImageBlob, как у загруженных через API.
+        """
+        storage = Recipe._meta.get_field('image').storage
+        names = []
+        for number in range(count):
+            buffer = io.BytesIO()
+            color = tuple(self.random.randrange(256) for _ in range(3))
+            Image.new('RGB', (64, 64), color).save(buffer, 'PNG')
+            names.append(storage.save(
+                PLACEHOLDER_NAME.format(number=number),
+                ContentFile(buffer.getvalue()),
+            ))
+        return names
+
+    def free_numbers(self, count, start):
+        """
+        Номера для user{number}, не занятые ни юзернеймом, ни почтой:
+        повторный запуск или ручные записи не ломают bulk_create.
+        """
+        taken = set(User.objects.filter(
+            username__startswith=USERNAME_PREFIX
+        ).values_list('username', flat=True))
+        taken.update(User.objects.filter(
+            email__startswith=USERNAME_PREFIX, email__endswith=EMAIL_DOMAIN
+        ).values_list('email', flat=True))
+        number = start
+        while count:
+            number += 1
+            username = f'{USERNAME_PREFIX}{number}'
+            if username in taken or f'{username}{EMAIL_DOMAIN}' in taken:
+                continue
+            count -= 1
+            yield number
+
+    def create_users(self, count):
+        last_id = User.objects.aggregate(last=Max('id'))['last'] or 0
+        password = make_password(None)
+        self.create_in_batches(User, (
+            User(
+                username=f'{USERNAME_PREFIX}{number}',
+                email=f'{USERNAME_PREFIX}{number}{EMAIL_DOMAIN}',
+                first_name=f'Имя{number}',
+                last_name=f'Фамилия{number}',
+                password=password,
+            )
+            for number in self.free_numbers(count, last_id)
+        ), 'Пользователи')
+        return self.new_ids(User, last_id)
+
+    def create_recipes(self, count, user_ids, images):
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        self.random.shuffle(ingredient_ids)
+        author_weights = zipf_cum_weights(len(user_ids), self.zipf)
+        ingredient_weights = zipf_cum_weights(len(ingredient_ids), self.zipf)
+        last_id = Recipe.objects.aggregate(last=Max('id'))['last'] or 0
+        recipe_ids = []
+        references = Counter()
+        with tqdm(total=count, desc='Рецепты') as pbar:
+            for start in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - start)
+                authors = self.random.choices(
+                    user_ids, cum_weights=author_weights, k=size
+                )
+                recipes = [
+                    Recipe(
+                        name=f'Рецепт {start + number}',
+                        text='Описание рецепта. ' * self.random.randint(1, 20),
+                        cooking_time=self.random.randint(5, 180),
+                        image=self.random.choice(images),
+                        author_id=author,
+                    )
+                    for number, author in enumerate(authors)
+                ]
+                references.update(recipe.image.name for recipe in recipes)
+                Recipe.objects.bulk_create(recipes)
+                batch_ids = self.new_ids(Recipe, last_id)
+                last_id = batch_ids[-1]
+                recipe_ingredients = []
+                recipe_tags = []
+                for recipe_id in batch_ids:
+                    chosen = set(self.random.choices(
+                        ingredient_ids, cum_weights=ingredient_weights,
+                        k=round(self.random.triangular(2, 15, 6)),
+                    ))
+                    recipe_ingredients.extend(
+                        RecipeIngredient(
+                            recipe_id=recipe_id,
+                            ingredient_id=ingredient_id,
+                            amount=self.random.randint(1, 500),
+                        )
+                        for ingredient_id in chosen
+                    )
+                    recipe_tags.extend(
+                        Recipe.tags.through(recipe_id=recipe_id, tag_id=tag)
+                        for tag in self.random.sample(
+                            tag_ids, self.random.randint(1, len(tag_ids))
+                        )
+                    )
+                RecipeIngredient.objects.bulk_create(recipe_ingredients)
+                Recipe.tags.through.objects.bulk_create(recipe_tags)
+                recipe_ids.extend(batch_ids)
+                pbar.update(len(batch_ids))
+        for name, count in references.items():
+            change_references(name, count)
+        return recipe_ids
+
+    def popular_pairs(self, user_ids, targets, average, factory):
+        """Пары пользователь — объект, популярность объектов по Ципфу."""
+        if not targets:
+            return
+        weights = zipf_cum_weights(len(targets), self.zipf)
+        for user_id in user_ids:
+            size = min(
+                int(self.random.expovariate(1 / average)), len(targets)
+            ) if average else 0
+            chosen = set(self.random.choices(
+                targets, cum_weights=weights, k=size
+            ))
+            for target in chosen:
+                obj = factory(user_id, target)
+                if obj is not None:
+                    yield obj
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users: нужен хотя бы один автор рецептов.')
+        if options['recipes'] < 0:
+            raise CommandError('--recipes не может быть отрицательным.')
+        if options['recipes'] and options['images'] < 1:
+            raise CommandError('--images: рецептам нужна картинка.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        if not (Ingredient.objects.exists() and Tag.objects.exists()):
+            raise CommandError(
+                'Сначала загрузите ингредиенты и теги: db_import_data.'
+            )
+        self.random = random.Random(options['seed'])
+        self.zipf = options['zipf']
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            images = self.create_placeholders(options['images'])
+            user_ids = self.create_users(options['users'])
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, images
+            )
+            popular_recipes = self.random.sample(recipe_ids, len(recipe_ids))
+            self.create_in_batches(Favorite, self.popular_pairs(
+                user_ids, popular_recipes, options['favorites'],
+                lambda user, recipe: Favorite(user_id=user, recipe_id=recipe),
+            ), 'Избранное')
+            self.create_in_batches(Cart, self.popular_pairs(
+                user_ids, popular_recipes, options['carts'],
+                lambda user, recipe: Cart(user_id=user, recipe_id=recipe),
+            ), 'Корзины')
+            self.create_in_batches(Follow, self.popular_pairs(
+                user_ids, user_ids, options['follows'],
+                lambda user, author: Follow(user_id=user, author_id=author)
+                if user != author else None,
+            ), 'Подписки')
+            bump_catalog_version()
+            record_recipe_changes(None)
+            bump_recipe_facets_version()
+        self.stdout.write(self.style.SUCCESS(
+            'Тестовые данные успешно сгенерированы!'
+        ))
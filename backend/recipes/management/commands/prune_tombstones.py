@@ -0,0 +1,37 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.models import RecipeTombstone
+
+
+class Command(BaseCommand):
+    """
+    Удаление старых отметок об удалённых рецептах. Срок хранения
+    RECIPE_TOMBSTONE_DAYS общий с /api/recipes/changes/: клиент с более
+    старым токеном получает 410 и синхронизируется заново целиком.
+    """
+    help = 'Удалить отметки об удалённых рецептах старше срока хранения.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        expired = RecipeTombstone.objects.filter(
+            deleted_at__lt=timezone.now() - datetime.timedelta(
+                days=settings.RECIPE_TOMBSTONE_DAYS
+            )
+        )
+        if options['dry_run']:
+            count = expired.count()
+        else:
+            count, _ = expired.delete()
+        self.stdout.write(self.style.SUCCESS(
+            '{}: {} отметок старше {} дней.'.format(
+                'Будет удалено' if options['dry_run'] else 'Удалено',
+                count,
+                settings.RECIPE_TOMBSTONE_DAYS,
+            )
+        ))
@@ -4,8 +4,15 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.utils import timezone
 
-from recipes.constans import MAX_LENGTH_COLOR, MAX_LENGTH_NAME, MIN_VALUE
+from recipes.constans import (
+    MAX_LENGTH_COLOR,
+    MAX_LENGTH_IMAGE_NAME,
+    MAX_LENGTH_NAME,
+    MIN_VALUE,
+)
+from recipes.storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -49,6 +56,7 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение рецепта',
         upload_to='recipes/',
+        storage=ContentAddressedStorage(),
     )
     ingredients = models.ManyToManyField(
         'Ingredient',
@@ -66,11 +74,20 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('updated_at', 'id'), name='recipe_updated_at_id'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -220,3 +237,53 @@ class Favorite(models.Model):
 
     def __str__(self):
         return f'{self.user} добавлено в избраное {self.recipe}'
+
+
+class ImageBlob(models.Model):
+    """Файл изображения в хранилище по хешу и число рецептов с ним."""
+    name = models.CharField(
+        verbose_name='Файл',
+        max_length=MAX_LENGTH_IMAGE_NAME,
+        unique=True,
+    )
+    size = models.PositiveIntegerField(verbose_name='Размер, байт')
+    refcount = models.IntegerField(verbose_name='Ссылок', default=0)
+    touched = models.DateTimeField(
+        verbose_name='Последнее использование',
+        default=timezone.now,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Файл изображения'
+        verbose_name_plural = 'Файлы изображений'
+        ordering = ['-touched']
+
+    def __str__(self):
+        return f'{self.name} ({self.refcount})'
+
+
+class RecipeTombstone(models.Model):
+    """Отметка об удалённом рецепте для синхронизации клиентов."""
+    recipe_id = models.PositiveIntegerField(
+        verbose_name='Id рецепта',
+        unique=True,
+    )
+    deleted_at = models.DateTimeField(
+        verbose_name='Дата удаления',
+        default=timezone.now,
+    )
+
+    class Meta:
+        verbose_name = 'Удалённый рецепт'
+        verbose_name_plural = 'Удалённые рецепты'
+        ordering = ('-deleted_at',)
+        indexes = (
+            models.Index(
+                fields=('deleted_at', 'recipe_id'),
+                name='tombstone_deleted_at_recipe',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id} удалён {self.deleted_at}'
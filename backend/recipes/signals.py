@@ -0,0 +1,91 @@
+from django.db import router, transaction
+from django.db.models import signals
+from django.dispatch import receiver
+from django.utils import timezone
+
+from recipes.models import Ingredient, Recipe, RecipeTombstone, Tag
+from recipes.storage import change_references
+
+
+def touch_recipes(recipes):
+    """
+    Представление рецептов изменилось без сохранения самих рецептов:
+    они должны попасть в /api/recipes/changes/.
+    """
+    recipes.update(updated_at=timezone.now())
+    stamp_after_commit(recipes, 'updated_at')
+
+
+def stamp_after_commit(queryset, field):
+    """
+    Отметка времени ставится при записи, а другим видна только после
+    фиксации. Лента /api/recipes/changes/ не ждёт транзакции дольше
+    RECIPE_SYNC_LAG, поэтому внутри транзакции строки отмечаются ещё раз
+    сразу после фиксации и попадают в ленту заново.
+    """
+    using = router.db_for_write(queryset.model)
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(
+            lambda: queryset.using(using).update(
+                **{field: timezone.now()}
+            ),
+            using=using,
+        )
+
+
+@receiver(signals.pre_save, sender=Recipe)
+def remember_recipe_image(sender, instance, update_fields, **kwargs):
+    instance.previous_image = None
+    if instance.pk and (update_fields is None or 'image' in update_fields):
+        instance.previous_image = Recipe.objects.filter(
+            pk=instance.pk
+        ).values_list('image', flat=True).first()
+
+
+@receiver(signals.post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, update_fields, **kwargs):
+    """Счётчики ссылок на старый и новый файл изображения."""
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = getattr(instance, 'previous_image', None)
+    if instance.image.name != previous:
+        change_references(instance.image.name, 1)
+        change_references(previous, -1)
+
+
+@receiver(signals.post_save, sender=Recipe)
+def recipe_stamped(sender, instance, update_fields, **kwargs):
+    if update_fields is None or 'updated_at' in update_fields:
+        stamp_after_commit(
+            Recipe.objects.filter(pk=instance.pk), 'updated_at'
+        )
+
+
+@receiver(signals.post_delete, sender=Recipe)
+def recipe_image_released(sender, instance, **kwargs):
+    change_references(instance.image.name, -1)
+
+
+@receiver(signals.post_delete, sender=Recipe)
+def recipe_tombstone(sender, instance, **kwargs):
+    """Удаление видно клиентам в /api/recipes/changes/."""
+    RecipeTombstone.objects.update_or_create(
+        recipe_id=instance.pk, defaults={'deleted_at': timezone.now()}
+    )
+    stamp_after_commit(
+        RecipeTombstone.objects.filter(recipe_id=instance.pk), 'deleted_at'
+    )
+
+
+@receiver(signals.post_save, sender=Tag)
+@receiver(signals.pre_delete, sender=Tag)
+def tag_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(tags=instance))
+
+
+@receiver(signals.post_save, sender=Ingredient)
+@receiver(signals.pre_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        touch_recipes(Recipe.objects.filter(ingredients=instance))
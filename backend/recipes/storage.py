@@ -0,0 +1,100 @@
+"""
+Хранилище изображений по хешу содержимого.
+
+Файл сохраняется под именем <каталог>/<ab>/<sha256>.<расширение>:
+одинаковые картинки хранятся один раз, а имя файла никогда не меняет
+содержимого, поэтому его можно кешировать навсегда. Каждому файлу
+соответствует строка ImageBlob со счётчиком ссылок рецептов, файлы
+без ссылок удаляет команда gc_images.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from recipes.constans import IMAGE_HASH_PREFIX
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def is_hashed(name):
+    return bool(name and HASHED_NAME.search(name))
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, где имя файла — хеш его содержимого."""
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        return os.path.join(
+            os.path.dirname(name),
+            digest[:IMAGE_HASH_PREFIX],
+            digest + os.path.splitext(name)[1].lower(),
+        ).replace('\\', '/')
+
+    def get_available_name(self, name, max_length=None):
+        """Одинаковое имя означает одинаковое содержимое: имя не меняется."""
+        return name
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return super().save(
+            self.hashed_name(name, content), content, max_length
+        )
+
+    def _save(self, name, content):
+        """
+        Сначала отмечается строка ImageBlob: команда gc_images удаляет
+        файл под блокировкой этой строки, поэтому после отметки файл
+        либо уже удалён, либо не будет удалён.
+        """
+        touch_blob(name, content.size)
+        path = self.path(name)
+        if os.path.exists(path):
+            return name
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temporary, self.file_permissions_mode)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return name
+
+
+def touch_blob(name, size):
+    """Создать или обновить строку ImageBlob без изменения счётчика."""
+    ImageBlob = apps.get_model('recipes', 'ImageBlob')
+    if not ImageBlob.objects.filter(name=name).update(
+        touched=timezone.now()
+    ):
+        ImageBlob.objects.get_or_create(name=name, defaults={'size': size})
+
+
+def change_references(name, delta):
+    """Изменить счётчик ссылок на файл, если он в хранилище по хешу."""
+    if not is_hashed(name):
+        return
+    ImageBlob = apps.get_model('recipes', 'ImageBlob')
+    ImageBlob.objects.filter(name=name).update(
+        refcount=F('refcount') + delta, touched=timezone.now()
+    )
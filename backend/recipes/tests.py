@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeTombstone, Tag
+from recipes.signals import stamp_after_commit
+from users.models import User
+
+
+class RecipeSignalTests(TestCase):
+    """Отметки времени для ленты изменений рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='author@example.com',
+            username='author',
+            first_name='Имя',
+            last_name='Фамилия',
+            password='password-123',
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+
+    def create_recipe(self):
+        recipe = Recipe.objects.create(
+            author=self.author,
+            name='Каша',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/test.png',
+        )
+        recipe.tags.add(self.tag)
+        return recipe
+
+    def test_delete_creates_tombstone(self):
+        recipe = self.create_recipe()
+        recipe_id = recipe.pk
+        recipe.delete()
+        self.assertTrue(
+            RecipeTombstone.objects.filter(recipe_id=recipe_id).exists()
+        )
+
+    def test_restamp_after_commit(self):
+        recipe = self.create_recipe()
+        stale = timezone.now() - timedelta(hours=1)
+        Recipe.objects.filter(pk=recipe.pk).update(updated_at=stale)
+        with self.captureOnCommitCallbacks(execute=True):
+            stamp_after_commit(
+                Recipe.objects.filter(pk=recipe.pk), 'updated_at'
+            )
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.updated_at, stale)
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, stale)
+
+    def test_tag_change_touches_recipes(self):
+        recipe = self.create_recipe()
+        stale = timezone.now() - timedelta(hours=1)
+        Recipe.objects.filter(pk=recipe.pk).update(updated_at=stale)
+        self.tag.name = 'Ужин'
+        self.tag.save()
+        recipe.refresh_from_db()
+        self.assertGreater(recipe.updated_at, stale)
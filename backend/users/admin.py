@@ -1,12 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from rest_framework.authtoken.models import Token
+
+from api import tasks
+from api.admin import FastDeleteAdminMixin
+from api.deletion import delete_users, fast_delete
+from recipes.models import Recipe
 from users.models import User
 
 
 @admin.register(User)
-class CustomUserAdmin(BaseUserAdmin):
+class CustomUserAdmin(FastDeleteAdminMixin, BaseUserAdmin):
     """Кастомные настройки административного интерфейса для модели User."""
+    delete_function = staticmethod(delete_users)
+    delete_task = tasks.delete_users
     list_display = ('username', 'email', 'recipe_count', 'follower_count')
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
@@ -32,3 +40,18 @@ class CustomUserAdmin(BaseUserAdmin):
     def follower_count(self, obj):
         """Функция для отображения количества подписчиков."""
         return obj.following.count()
+
+    def deletion_size(self, queryset):
+        return queryset.count() + Recipe.objects.filter(
+            author__in=queryset
+        ).count()
+
+    def offload(self, request, queryset):
+        """До фонового удаления пользователи выключаются и теряют токены."""
+        queryset.update(is_active=False)
+        fast_delete(Token.objects.filter(user__in=queryset))
+        pks = list(queryset.values_list('pk', flat=True))
+        return self.delete_task.enqueue(
+            args=[pks],
+            user=None if request.user.pk in pks else request.user,
+        )
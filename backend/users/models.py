@@ -43,3 +43,14 @@ class User(AbstractUser):
 
     def __str__(self):
         return self.username
+
+    def refresh_from_db(self, using=None, fields=None):
+        """
+        Первое обращение к отложенному полю загружает все отложенные
+        поля одним запросом: пользователь из кеша токенов приходит
+        только с id и is_active.
+        """
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred.issuperset(fields):
+            fields = deferred
+        super().refresh_from_db(using=using, fields=fields)